@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    digest  TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    nbytes  INTEGER NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at);
+"""
+BATCH = 500  # digests per IN (...) lookup, under SQLite's variable limit
+
+
+def object_digest(key: str, etag: str) -> str:
+    return hashlib.sha1(f"{key}\0{etag}".encode()).hexdigest()
+
+
+class ResultCache:
+    # Parsed per-object results keyed by key+ETag; log objects are immutable
+    # once written, so an entry never needs invalidating, only evicting.
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        # running size of all payloads, kept in step by put() and _evict()
+        self._total = self._db.execute(
+            "SELECT COALESCE(SUM(nbytes), 0) FROM results").fetchone()[0]
+
+    def get(self, key: str, etag: str):
+        return self.get_many([{"Key": key, "ETag": etag}]).get(key)
+
+    def get_many(self, objects) -> dict:
+        # {key: counts} for the listing entries already cached, looked up
+        # and marked as used in one transaction rather than one per object
+        digests = {object_digest(o["Key"], o["ETag"]): o["Key"]
+                   for o in objects}
+        found = {}
+        batch = list(digests)
+        with self._lock, self._db:
+            for i in range(0, len(batch), BATCH):
+                part = batch[i:i + BATCH]
+                found.update(self._db.execute(
+                    "SELECT digest, payload FROM results "
+                    f"WHERE digest IN ({', '.join('?' * len(part))})",
+                    part))
+            now = time.time()
+            self._db.executemany(
+                "UPDATE results SET used_at = ? WHERE digest = ?",
+                [(now, digest) for digest in found])
+        return {digests[d]: json.loads(payload)
+                for d, payload in found.items()}
+
+    def put(self, key: str, etag: str, counts: dict):
+        payload = json.dumps(counts, separators=(",", ":"))
+        digest = object_digest(key, etag)
+        with self._lock, self._db:
+            old = self._db.execute(
+                "SELECT nbytes FROM results WHERE digest = ?",
+                (digest,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (digest, payload, len(payload), time.time()))
+            self._total += len(payload) - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        stale = []
+        for digest, nbytes in self._db.execute(
+                "SELECT digest, nbytes FROM results ORDER BY used_at"):
+            if self._total <= self.max_bytes:
+                break
+            stale.append((digest,))
+            self._total -= nbytes
+        self._db.executemany("DELETE FROM results WHERE digest = ?", stale)
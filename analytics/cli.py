@@ -0,0 +1,201 @@
+# Headless entry point for the Analyze pipeline.
+#
+#   python -m analytics.cli analyze --customer acme --days 7 -o acme.csv
+#   python -m analytics.cli compare --customers acme,globex --days 30
+#   python -m analytics.cli clients --customer acme --days 90
+#   python -m analytics.cli query --by date,report --days 30 -o daily.csv
+#   python -m analytics.cli warm --days 90
+#   python -m analytics.cli customers
+#
+# Credentials come from boto3's default chain (AWS_* env vars, --profile).
+import argparse
+import datetime
+import json
+import sys
+
+import boto3
+import pyarrow.compute as pc
+
+from analytics import config
+from analytics.client import make_s3_client
+from analytics.engine import AnalysisEngine
+from analytics.stats import RunStats
+
+FORMATS = ("csv", "parquet", "json")
+
+
+def date_range(args):
+    end = args.end or datetime.date.today()
+    start = args.start or end - datetime.timedelta(days=args.days)
+    if start > end:
+        raise SystemExit(f"start {start} is after end {end}")
+    return start, end
+
+
+def write_frame(df, path: str, fmt: str):
+    if fmt == "csv":
+        df.to_csv(path or sys.stdout, index=False)
+    elif fmt == "parquet":
+        if not path:
+            raise SystemExit("--format parquet needs --output")
+        df.to_parquet(path, index=False)
+    else:
+        df.to_json(path or sys.stdout, orient="records", indent=2)
+
+
+def print_stats(stats: RunStats):
+    for row in stats.rows():
+        print(json.dumps(row), file=sys.stderr)
+
+
+def output(df, stats: RunStats, args):
+    fmt = args.format or (args.output.rsplit(".", 1)[-1]
+                          if args.output else "csv")
+    if fmt not in FORMATS:
+        raise SystemExit(f"unknown output format {fmt!r}")
+    write_frame(df, args.output, fmt)
+    if args.stats:
+        print_stats(stats)
+
+
+def cmd_analyze(engine, s3, args):
+    start, end = date_range(args)
+    stats = RunStats()
+    df = engine.analyze(s3, args.customer, start, end, stats)
+    output(df, stats, args)
+
+
+def cmd_compare(engine, s3, args):
+    start, end = date_range(args)
+    stats = RunStats()
+    names = [name.strip() for name in args.customers.split(",")
+             if name.strip()]
+    df = engine.compare(s3, names, start, end, stats)
+    if args.wide:
+        df = (df.pivot_table(index="report", columns="customer",
+                             values="calls", fill_value=0)
+                .reset_index())
+    output(df, stats, args)
+
+
+def cmd_clients(engine, s3, args):
+    start, end = date_range(args)
+    stats = RunStats()
+    df = engine.clients(s3, args.customer, start, end, stats)
+    output(df, stats, args)
+
+
+def cmd_query(engine, s3, args):
+    # ad hoc aggregation over the stored event tables, e.g. --by hour,status
+    start, end = date_range(args)
+    stats = RunStats()
+    by = [name.strip() for name in args.by.split(",") if name.strip()]
+    where = None
+    if args.status:
+        where = pc.field("status").isin(args.status)
+    df = engine.query(s3, args.customer, start, end, by, where, stats)
+    output(df, stats, args)
+
+
+def cmd_warm(engine, s3, args):
+    # Runs the same analysis as the dashboard, so whatever it reads (the
+    # manifest, per-object cache, daily rollups and, with KEEP_EVENTS, the
+    # event tables) is filled for the range.  Analyzing "All" covers every
+    # customer; event tables beyond EVENT_STORE_MB are evicted afterwards.
+    start, end = date_range(args)
+    stats = RunStats()
+    df = engine.analyze(s3, args.customer, start, end, stats)
+    print(f"warmed {args.customer} {start}..{end}: "
+          f"{int(df['Calls'].sum())} calls, {len(df)} reports",
+          file=sys.stderr)
+    if args.stats:
+        print_stats(stats)
+
+
+def cmd_customers(engine, s3, args):
+    for cust in engine.customers(s3):
+        print(cust)
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m analytics.cli")
+    ap.add_argument("--bucket", default=config.BUCKET_NAME)
+    ap.add_argument("--profile", help="AWS profile to use")
+    ap.add_argument("--cache-dir", default=config.CACHE_DIR,
+                    help="on-disk caches; pass '' to disable")
+    ap.add_argument("--workers", type=int, default=config.FETCH_WORKERS)
+    ap.add_argument("--mode", default=config.PARSE_MODE,
+                    choices=["threads", "processes", "auto"])
+    ap.add_argument("--topk", type=int, default=config.TOPK_CAPACITY,
+                    help="analyze approximately with this many counters "
+                         "(0: exact counts)")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    def add_range(p, customer_default):
+        if customer_default is not None:
+            p.add_argument("--customer", default=customer_default)
+        p.add_argument("--start", type=datetime.date.fromisoformat)
+        p.add_argument("--end", type=datetime.date.fromisoformat)
+        p.add_argument("--days", type=int, default=7,
+                       help="range length when --start is not given")
+        p.add_argument("--stats", action="store_true",
+                       help="print per-stage stats to stderr as JSON")
+
+    def add_output(p):
+        p.add_argument("-o", "--output", help="output file (default: stdout)")
+        p.add_argument("--format", choices=FORMATS,
+                       help="default: from --output extension, else csv")
+
+    p = sub.add_parser("analyze", help="report counts for a customer/range")
+    add_range(p, "All")
+    add_output(p)
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("compare", help="customer x report calls")
+    add_range(p, None)
+    add_output(p)
+    p.add_argument("--customers", required=True,
+                   help="comma-separated customer names")
+    p.add_argument("--wide", action="store_true",
+                   help="one row per report, one column per customer")
+    p.set_defaults(func=cmd_compare)
+
+    p = sub.add_parser(
+        "clients", help="estimated distinct client IPs and users per report")
+    add_range(p, "All")
+    add_output(p)
+    p.set_defaults(func=cmd_clients)
+
+    p = sub.add_parser("query", help="calls grouped by event columns")
+    add_range(p, "All")
+    add_output(p)
+    p.add_argument("--by", default="report",
+                   help="comma-separated: report, customer, status, method, "
+                        "ip, user, path, date, hour, weekday "
+                        "(default: report)")
+    p.add_argument("--status", type=int, action="append",
+                   help="only these HTTP statuses (repeatable)")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("warm", help="pre-fill the on-disk caches")
+    add_range(p, "All")
+    p.set_defaults(func=cmd_warm)
+
+    p = sub.add_parser("customers", help="list known customers")
+    p.set_defaults(func=cmd_customers)
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile:
+        boto3.setup_default_session(profile_name=args.profile)
+    s3 = make_s3_client(max_pool_connections=2 * args.workers)
+    engine = AnalysisEngine(args.bucket, cache_dir=args.cache_dir,
+                            workers=args.workers, mode=args.mode,
+                            topk=args.topk)
+    args.func(engine, s3, args)
+
+
+if __name__ == "__main__":
+    main()
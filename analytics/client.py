@@ -0,0 +1,32 @@
+import boto3
+from botocore.config import Config
+
+from analytics.config import AWS_REGION, FETCH_WORKERS, S3_CLIENT_PROFILE
+
+
+def client_config(profile: dict = None, **overrides) -> Config:
+    settings = {**S3_CLIENT_PROFILE, **(profile or {}), **overrides}
+    return Config(
+        max_pool_connections=max(settings["max_pool_connections"],
+                                 FETCH_WORKERS),
+        retries={"mode": settings["retry_mode"],
+                 "max_attempts": settings["max_attempts"]},
+        connect_timeout=settings["connect_timeout"],
+        read_timeout=settings["read_timeout"],
+        tcp_keepalive=settings["tcp_keepalive"],
+    )
+
+
+def make_s3_client(key: str = None, secret: str = None,
+                   region: str = AWS_REGION, profile: dict = None,
+                   **overrides):
+    # without explicit keys boto3 falls back to its usual credential chain
+    # (environment, shared config/profile, instance role); `profile` and
+    # keyword overrides adjust S3_CLIENT_PROFILE
+    return boto3.client(
+        "s3",
+        aws_access_key_id=key,
+        aws_secret_access_key=secret,
+        region_name=region,
+        config=client_config(profile, **overrides),
+    )
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from analytics.hll import HyperLogLog
+from analytics.keys import customer_list
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sketches (
+    key       TEXT NOT NULL,
+    day       TEXT NOT NULL,
+    customer  TEXT NOT NULL,
+    report    TEXT NOT NULL,
+    kind      TEXT NOT NULL,  -- one of KINDS
+    registers BLOB NOT NULL,
+    PRIMARY KEY (key, report, kind)
+);
+CREATE INDEX IF NOT EXISTS sketches_day ON sketches (day, customer);
+CREATE TABLE IF NOT EXISTS sources (
+    key  TEXT PRIMARY KEY,
+    etag TEXT NOT NULL
+);
+"""
+# bumped when the tables change shape; older databases start over
+SCHEMA_VERSION = 4
+# keys per IN (...) lookup, as in ResultCache
+BATCH = 500
+
+# sketch kind -> event table column it counts; also distinct()'s columns
+KINDS = {"clients": "ip", "users": "user"}
+
+
+def table_sketches(table) -> dict:
+    # {(report, kind): HyperLogLog} of client IPs and authenticated users
+    # for one object's event table.  Adding a value twice changes nothing,
+    # so only each distinct (report, value) pair is hashed.
+    sketches = {}
+    reports = table.column("report").cast(pa.string())
+    for kind, column in KINDS.items():
+        pairs = (pa.table({"report": reports, "value": table.column(column)})
+                   .filter(pc.field("value") != "")
+                   .group_by(["report", "value"]).aggregate([]))
+        if not pairs.num_rows:
+            continue
+        names = pairs.column("report").combine_chunks().dictionary_encode()
+        groups = HyperLogLog.grouped(
+            names.indices.to_numpy(zero_copy_only=False),
+            pairs.column("value").combine_chunks(), len(names.dictionary))
+        for report, sketch in zip(names.dictionary.to_pylist(), groups):
+            sketches[report, kind] = sketch
+    return sketches
+
+
+class ClientSketches:
+    # HyperLogLog sketches of distinct client IPs and users for each
+    # (customer, report), one per parsed object and merged per query.  Only
+    # register maxima are stored, never the addresses.  `sources` records
+    # the ETag each object was sketched at, so a rewritten object replaces
+    # just its own sketches and the rest of its day stays put.
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                self._db.executescript(
+                    "DROP TABLE IF EXISTS sketches;"
+                    "DROP TABLE IF EXISTS sources;")
+                self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._db.executescript(SCHEMA)
+
+    def missing(self, objects) -> list:
+        # objects not sketched at their current ETag; sketches of an older
+        # version are dropped here, so distinct() never counts them
+        objects = list(objects)
+        known = {}
+        with self._lock, self._db:
+            for i in range(0, len(objects), BATCH):
+                keys = [obj["Key"] for obj in objects[i:i + BATCH]]
+                known.update(self._db.execute(
+                    "SELECT key, etag FROM sources "
+                    f"WHERE key IN ({', '.join('?' * len(keys))})", keys))
+            stale = [(obj["Key"],) for obj in objects
+                     if known.get(obj["Key"], obj["ETag"]) != obj["ETag"]]
+            self._db.executemany("DELETE FROM sketches WHERE key = ?", stale)
+            self._db.executemany("DELETE FROM sources WHERE key = ?", stale)
+        return [obj for obj in objects
+                if known.get(obj["Key"]) != obj["ETag"]]
+
+    def add(self, obj: dict, table):
+        self.merge(obj, table_sketches(table))
+
+    def merge(self, obj: dict, sketches: dict):
+        # stores table_sketches() of `obj`, computed wherever it was parsed;
+        # the values may already be HyperLogLog.to_bytes() blobs
+        key, etag = obj["Key"], obj["ETag"]
+        day, customer = obj["Date"], obj.get("Customer") or ""
+        rows = [(key, day, customer, report, kind,
+                 sketch if isinstance(sketch, bytes) else sketch.to_bytes())
+                for (report, kind), sketch in sketches.items()]
+        with self._lock, self._db:
+            if self._db.execute(
+                    "SELECT 1 FROM sources WHERE key = ? AND etag = ?",
+                    (key, etag)).fetchone():
+                return
+            self._db.execute("DELETE FROM sketches WHERE key = ?", (key,))
+            self._db.executemany(
+                "INSERT INTO sketches VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)",
+                             (key, etag))
+
+    def distinct(self, customer, start, end) -> pd.DataFrame:
+        # distinct client IPs and users per report over the range (columns
+        # report, clients, users), by merging the objects' sketches
+        sql = ("SELECT report, kind, registers FROM sketches "
+               "WHERE day BETWEEN ? AND ?")
+        args = [start.isoformat(), end.isoformat()]
+        names = customer_list(customer)
+        if names:
+            sql += f" AND customer IN ({', '.join('?' * len(names))})"
+            args.extend(names)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        # merged outside the lock, in one pass per report
+        by_report = {}
+        for report, kind, registers in rows:
+            by_report.setdefault(report, {}).setdefault(kind, []).append(
+                registers)
+        return (
+            pd.DataFrame(
+                [[report] + [HyperLogLog.union(kinds.get(kind, ())).count()
+                             for kind in KINDS]
+                 for report, kinds in by_report.items()],
+                columns=["report", *KINDS])
+              .sort_values(["clients", "report"], ascending=[False, True],
+                           ignore_index=True)
+        )
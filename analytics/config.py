@@ -0,0 +1,30 @@
+import os
+
+BUCKET_NAME = "data-eng-datalake-test"
+AWS_REGION = "us-west-2"
+FETCH_WORKERS = 16  # concurrent GETs during Analyze
+# boto3 client tuning, see analytics/client.py; the pool is never smaller
+# than FETCH_WORKERS so concurrent GETs don't queue for a connection
+S3_CLIENT_PROFILE = {
+    "max_pool_connections": 2 * FETCH_WORKERS,
+    "retry_mode": "adaptive",  # client-side rate limiting on throttling
+    "max_attempts": 10,
+    "connect_timeout": 5,
+    "read_timeout": 60,
+    "tcp_keepalive": True,
+}
+PARSE_MODE = "auto"  # "threads", "processes", or "auto" by data volume
+CACHE_DIR = os.path.join(".cache", BUCKET_NAME)
+MANIFEST_TTL = 300  # seconds before a prefix is re-listed
+CUSTOMER_LIST_TTL = 900  # seconds between incremental customer refreshes
+RESULT_CACHE_MB = 256  # parsed per-object counts kept on disk
+KEEP_EVENTS = True  # also keep per-object columnar event tables on disk
+# client IPs and users in those tables; when False they are blanked once the
+# distinct-client sketches have them, so `query --by ip` has nothing to group
+KEEP_CLIENT_IDS = False
+EVENT_STORE_MB = 2048
+# >0 analyzes with an approximate top-K summary of this many counters
+# instead of exact counts for every distinct report
+TOPK_CAPACITY = 0
+LOG_RUN_STATS = False  # also emit each run's stage stats as a JSON log line
+CONNECT_CHECK_TTL = 600  # seconds a successful credential check is trusted
@@ -0,0 +1,380 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from analytics import config
+from analytics.cache import ResultCache
+from analytics.clients import ClientSketches
+from analytics.events import EventStore, event_stage, has_client_ids
+from analytics.fetch import fetch_each
+from analytics.keys import key_customer, list_customers, plan_keys
+from analytics.manifest import KeyManifest
+from analytics.parsing import merge_counts
+from analytics.query import calls_by, scan
+from analytics.rollups import RollupStore
+from analytics.stats import RunStats
+from analytics.topk import SpaceSaving
+
+
+class Cancelled(Exception):
+    pass
+
+
+def to_frame(counts: dict) -> pd.DataFrame:
+    return (
+        pd.DataFrame.from_dict(counts, orient="index", columns=["Calls"])
+          .rename_axis("Report")
+          .reset_index()
+          .sort_values("Calls", ascending=False)
+    )
+
+
+def sketch_frame(sketch: SpaceSaving) -> pd.DataFrame:
+    # Calls are upper bounds, each at most Error above the true count;
+    # attrs["floor"] bounds any report that isn't listed
+    df = pd.DataFrame(sketch.top(), columns=["Report", "Calls", "Error"])
+    df.attrs["floor"] = sketch.floor
+    return df
+
+
+class AnalysisEngine:
+    # The Analyze pipeline: plan keys, fetch & parse, aggregate.
+    #
+    # With a `cache_dir`, keys come from the on-disk manifest and results go
+    # through the per-object cache and daily rollups; without one, every run
+    # lists and fetches from scratch.  `fetch` is the fetch-and-parse stage
+    # and takes fetch_each's arguments, yielding (object, counts) pairs; with
+    # `keep_events` it defaults to one that also stores per-object event
+    # tables for ad-hoc breakdowns and hourly series (see `query()`), while
+    # analyze() still answers from the counts and rollups.  Those tables
+    # hold client IPs and users only with `keep_client_ids`.
+    #
+    # `customer` is "All", a customer name or a list of names (see compare),
+    # and `objects` skips planning by passing a plan made earlier.
+    # A `topk` capacity makes analyze() approximate (see top_reports).
+
+    def __init__(self, bucket: str = config.BUCKET_NAME,
+                 cache_dir: str = config.CACHE_DIR,
+                 workers: int = config.FETCH_WORKERS,
+                 mode: str = config.PARSE_MODE,
+                 manifest_ttl: float = config.MANIFEST_TTL,
+                 cache_mb: int = config.RESULT_CACHE_MB,
+                 keep_events: bool = config.KEEP_EVENTS,
+                 keep_client_ids: bool = config.KEEP_CLIENT_IDS,
+                 events_mb: int = config.EVENT_STORE_MB,
+                 topk: int = config.TOPK_CAPACITY,
+                 fetch=None):
+        self.bucket = bucket
+        self.topk = topk
+        self.client_ids = keep_client_ids
+        self.workers = workers
+        self.mode = mode
+        self.fetch = fetch or fetch_each
+        self.manifest = self.cache = self.rollups = None
+        self.events_store = self.sketches = None
+        if cache_dir:
+            self.manifest = KeyManifest(
+                os.path.join(cache_dir, "manifest.sqlite"), ttl=manifest_ttl)
+            self.cache = ResultCache(
+                os.path.join(cache_dir, "results.sqlite"),
+                max_bytes=cache_mb * 1024 * 1024)
+            self.rollups = RollupStore(os.path.join(cache_dir, "rollups"))
+            self.sketches = ClientSketches(
+                os.path.join(cache_dir, "clients.sqlite"))
+        if cache_dir and keep_events:
+            self.events_store = EventStore(
+                os.path.join(cache_dir, "events"),
+                max_bytes=events_mb * 1024 * 1024)
+            self.fetch = fetch or event_stage(
+                self.events_store, self.sketches, keep_client_ids)
+
+    def customers(self, s3, full: bool = False) -> list:
+        if self.manifest is None:
+            return list_customers(s3, self.bucket, workers=self.workers)
+        return self.manifest.refresh_customers(
+            s3, self.bucket, full=full, workers=self.workers)
+
+    def plan(self, s3, customer, start, end, stats=None) -> list:
+        stats = stats or RunStats()
+        if self.manifest is None:
+            with stats.timed("list"):
+                keys = plan_keys(s3, self.bucket, customer, start, end, stats)
+            return [{"Key": key, "ETag": "", "Customer": key_customer(key)}
+                    for key in keys]
+
+        # pick up new keys since the last run, then select from the manifest
+        with stats.timed("list"):
+            self.manifest.refresh_customer(s3, self.bucket, customer,
+                                           stats=stats)
+        with stats.timed("lookup"):
+            return self.manifest.lookup(customer, start, end)
+
+    def _planned(self, s3, customer, start, end, stats,
+                 objects=None) -> list:
+        # `objects` is a plan the caller already made for this range, e.g.
+        # AnalysisJob reusing its run's plan for the follow-up views
+        if objects is not None:
+            return objects
+        return self.plan(s3, customer, start, end, stats)
+
+    def results(self, s3, objects, stats=None):
+        return self.fetch(s3, self.bucket, objects, workers=self.workers,
+                          cache=self.cache, mode=self.mode, stats=stats)
+
+    def _each(self, s3, objects, stats, progress, cancel, fetch=None):
+        if progress:
+            progress.plan(objects)
+        if fetch is None:
+            stream = self.results(s3, objects, stats)
+        else:
+            stream = fetch(s3, self.bucket, objects, workers=self.workers,
+                           mode=self.mode, stats=stats)
+        try:
+            for obj, part in stream:
+                yield obj, part
+                if progress:
+                    progress.add(part, obj)
+                if cancel is not None and cancel.is_set():
+                    break
+        finally:
+            # stops outstanding fetches when we bail out early
+            stream.close()
+
+    def _collect(self, s3, objects, stats, progress, cancel,
+                 fetch=None) -> list:
+        return list(self._each(s3, objects, stats, progress, cancel, fetch))
+
+    def counts(self, s3, customer, start, end, stats=None,
+               progress=None, cancel=None, objects=None) -> dict:
+        # `progress` is told about planned objects and each partial result
+        # (see jobs.Progress); setting the `cancel` event stops the run with
+        # Cancelled, keeping whatever was already parsed.
+        stats = stats or RunStats()
+        objects = self._planned(s3, customer, start, end, stats, objects)
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+        if self.rollups is None:
+            with stats.timed("fetch"):
+                results = self._collect(s3, objects, stats, progress, cancel)
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+            counts = {}
+            for _, part in results:
+                merge_counts(counts, part)
+            return counts
+
+        self._fill_rollups(s3, customer, start, end, objects, stats,
+                           progress, cancel)
+        with stats.timed("rollup"):
+            return self.rollups.totals(customer, start, end)
+
+    def _fill_rollups(self, s3, customer, start, end, objects, stats,
+                      progress=None, cancel=None):
+        # fetch & parse only what the daily rollups lack, so the range can
+        # be answered from the pre-aggregated rows
+        with stats.timed("rollup"):
+            missing = self.rollups.missing(objects)
+            if progress:
+                progress.add(self.rollups.totals(customer, start, end))
+        with stats.timed("fetch"):
+            results = self._collect(s3, missing, stats, progress, cancel)
+        with stats.timed("rollup"):
+            self.rollups.add(results)
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+
+    def timeseries(self, s3, customer, start, end, freq: str = "day",
+                   stats=None, progress=None, cancel=None,
+                   objects=None) -> pd.DataFrame:
+        # Calls per report per day from the daily rollups, or per hour from
+        # the stored event tables; columns are date (or hour), report, calls.
+        if freq == "hour":
+            df = self.query(s3, customer, start, end, by=("hour", "report"),
+                            stats=stats, progress=progress, cancel=cancel,
+                            objects=objects)
+            return df.sort_values(["hour", "report"], ignore_index=True)
+        if freq != "day":
+            raise ValueError(f"unknown freq {freq!r}")
+        if self.rollups is None:
+            raise ValueError("engine was created without a cache_dir")
+        stats = stats or RunStats()
+        objects = self._planned(s3, customer, start, end, stats, objects)
+        self._fill_rollups(s3, customer, start, end, objects, stats,
+                           progress, cancel)
+        with stats.timed("rollup"):
+            return self.rollups.daily(customer, start, end)
+
+    def _require_events(self):
+        if self.events_store is None:
+            raise ValueError("engine was created without an event store")
+
+    def _event_paths(self, s3, customer, start, end, objects, stats,
+                     progress=None, cancel=None) -> list:
+        # Parse whatever has no stored event table yet, then return the
+        # table paths for all of `objects`; callers pin `objects` first.
+        # The rollups are filled first, through the event stage, so a cold
+        # object is read once for both and `progress` gets its counts from
+        # them rather than from scanning the stored tables.
+        self._fill_rollups(s3, customer, start, end, objects, stats,
+                           progress, cancel)
+        missing = [o for o in objects if not self.events_store.has(o)]
+        with stats.timed("fetch"):
+            # only tables left to (re)write: evicted ones and counts cache
+            # hits, whose counts the rollups already hold
+            self._collect(s3, missing, stats, None, cancel,
+                          fetch=event_stage(self.events_store, self.sketches,
+                                            self.client_ids))
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+        return self.events_store.paths(objects)
+
+    def events(self, s3, customer, start, end, stats=None,
+               where=None, objects=None) -> pa.Table:
+        # every parsed request in the range as one columnar table
+        self._require_events()
+        stats = stats or RunStats()
+        objects = self._planned(s3, customer, start, end, stats, objects)
+        with self.events_store.pinned(objects):
+            paths = self._event_paths(s3, customer, start, end, objects,
+                                      stats)
+            with stats.timed("query"):
+                return scan(paths, where=where)
+
+    def query(self, s3, customer, start, end, by=("report",),
+              where=None, stats=None, progress=None,
+              cancel=None, objects=None) -> pd.DataFrame:
+        # Calls grouped by any event columns (report, status, customer, ip,
+        # method, path, date) or derived keys (hour, weekday), optionally
+        # filtered by a pyarrow.compute expression, e.g.
+        #   engine.query(s3, "All", start, end, by=["customer", "status"],
+        #                where=pc.field("status") >= 500)
+        self._require_events()
+        stats = stats or RunStats()
+        objects = self._planned(s3, customer, start, end, stats, objects)
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+        # pinned, so tables written early in a run larger than the store
+        # aren't evicted before the query reads them
+        with self.events_store.pinned(objects):
+            paths = self._event_paths(s3, customer, start, end, objects,
+                                      stats, progress, cancel)
+            with stats.timed("query"):
+                return calls_by(paths, by, where)
+
+    def clients(self, s3, customer, start, end, stats=None, progress=None,
+                cancel=None, objects=None) -> pd.DataFrame:
+        # Estimated distinct client IPs and authenticated users per report
+        # (columns report, clients, users) from merged per-object
+        # HyperLogLog sketches.  Objects not sketched yet (or rewritten since)
+        # are read from the event store, or else fetched and parsed once.
+        if self.sketches is None:
+            raise ValueError("engine was created without a cache_dir")
+        stats = stats or RunStats()
+        objects = self._planned(s3, customer, start, end, stats, objects)
+        todo = []
+        redacted = []  # stored without IPs and users (keep_client_ids off)
+        with stats.timed("sketch"):
+            for obj in self.sketches.missing(objects):
+                table = self.events_store.get(obj) if self.events_store \
+                    else None
+                if table is None:
+                    todo.append(obj)
+                elif not has_client_ids(table):
+                    redacted.append(obj)
+                else:
+                    self.sketches.add(obj, table)
+        # the raw logs of `redacted` are parsed again without the store,
+        # whose tables would otherwise be taken as already parsed
+        for pending, store in ((todo, self.events_store), (redacted, None)):
+            stage = event_stage(store, self.sketches, self.client_ids)
+            with stats.timed("fetch"):
+                for _ in self._each(s3, pending, stats, progress, cancel,
+                                    stage):
+                    pass
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+        with stats.timed("sketch"):
+            return self.sketches.distinct(customer, start, end)
+
+    def top_reports(self, s3, customer, start, end, stats=None,
+                    progress=None, cancel=None,
+                    objects=None) -> SpaceSaving:
+        # Approximate heavy hitters within `topk` counters.  Each stored
+        # rollup day and each newly parsed object is folded into the summary
+        # as it arrives, so memory is bounded by the budget (plus one day or
+        # object) however many distinct report names the range holds.
+        # Parsed objects still go to the per-object cache, not the rollups.
+        stats = stats or RunStats()
+        objects = self._planned(s3, customer, start, end, stats, objects)
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+        sketch = SpaceSaving(self.topk)
+        pending = objects
+        if self.rollups is not None:
+            with stats.timed("rollup"):
+                pending = self.rollups.missing(objects)
+                for day in self.rollups.day_totals(customer, start, end):
+                    sketch.update(day)
+                    if progress:
+                        progress.add(day)
+        with stats.timed("fetch"):
+            for _, part in self._each(s3, pending, stats, progress, cancel):
+                sketch.update(part)
+        if cancel is not None and cancel.is_set():
+            raise Cancelled()
+        return sketch
+
+    def compare(self, s3, customers: list, start, end, stats=None,
+                progress=None, cancel=None, objects=None) -> pd.DataFrame:
+        # Calls per (customer, report) for several customers.  The keys of
+        # all of them are planned together and fetched in one pass, so the
+        # cost follows the selected data, not the number of customers.
+        stats = stats or RunStats()
+        with stats.timed("total"):
+            objects = self._planned(s3, customers, start, end, stats, objects)
+            if cancel is not None and cancel.is_set():
+                raise Cancelled()
+            if self.rollups is not None:
+                self._fill_rollups(s3, customers, start, end, objects, stats,
+                                   progress, cancel)
+                with stats.timed("rollup"):
+                    df = self.rollups.query(customers, start, end)
+            else:
+                with stats.timed("fetch"):
+                    results = self._collect(s3, objects, stats, progress,
+                                            cancel)
+                if cancel is not None and cancel.is_set():
+                    raise Cancelled()
+                df = pd.DataFrame(
+                    [(obj["Customer"], report, n)
+                     for obj, counts in results
+                     for report, n in counts.items()],
+                    columns=["customer", "report", "calls"])
+            with stats.timed("dataframe"):
+                return (
+                    df.groupby(["customer", "report"], as_index=False)
+                      ["calls"].sum()
+                      .sort_values("calls", ascending=False,
+                                   ignore_index=True)
+                )
+
+    def analyze(self, s3, customer: str, start, end, stats=None,
+                progress=None, cancel=None, objects=None) -> pd.DataFrame:
+        stats = stats or RunStats()
+        with stats.timed("total"):
+            if self.topk:
+                sketch = self.top_reports(s3, customer, start, end, stats,
+                                          progress, cancel, objects)
+                with stats.timed("dataframe"):
+                    return sketch_frame(sketch)
+            counts = self.counts(s3, customer, start, end, stats,
+                                 progress, cancel, objects)
+            with stats.timed("dataframe"):
+                return to_frame(counts)
+
+
+def analyze(client, customer: str, start, end, stats=None,
+            **engine_args) -> pd.DataFrame:
+    return AnalysisEngine(**engine_args).analyze(
+        client, customer, start, end, stats)
@@ -0,0 +1,290 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from analytics.cache import object_digest
+from analytics.clients import table_sketches
+from analytics.fetch import fetch_each
+from analytics.keys import parse_log_key
+from analytics.parsing import parse_object
+
+# Combined-log prefix (client IP, authenticated user and [timestamp]) when
+# present, then the same first GET/POST request per line as
+# parsing.REQUEST_RE, then the status.
+EVENT_RE = re.compile(
+    rb'^(?:(\S*) \S* (\S*) \[([^\]\n]*)\] )?[^\n]*?'
+    rb'"(GET|POST) (.*?) HTTP/1\.\d"(?: (\d{3}))?.*',
+    re.M)
+TS_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+_category = pa.dictionary(pa.int32(), pa.string())
+SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("ts", pa.timestamp("s", tz="UTC")),
+    ("customer", _category),
+    ("ip", pa.string()),
+    ("user", pa.string()),
+    ("method", _category),
+    ("path", pa.string()),
+    ("report", _category),
+    ("status", pa.int16()),
+])
+# identify a client; see drop_client_ids
+CLIENT_COLUMNS = ("ip", "user")
+# bumped whenever SCHEMA changes, so stored tables of an older shape are
+# re-parsed rather than read (and are evicted first, being least recent)
+STORE_VERSION = 2
+
+
+def _text(values) -> pa.Array:
+    arr = pa.array(values, pa.binary())
+    try:
+        return arr.cast(pa.string())
+    except pa.ArrowInvalid:  # not UTF-8; rare enough to decode one by one
+        return pa.array([v.decode(errors="replace") for v in values],
+                        pa.string())
+
+
+def _blank(arr: pa.Array, values=("",)) -> pa.Array:
+    # `values` (the empty match, "-") become null
+    return pc.if_else(pc.is_in(arr, pa.array(values, pa.string())),
+                      pa.scalar(None, pa.string()), arr)
+
+
+def _reports(paths: pa.Array) -> pa.DictionaryArray:
+    # parsing.report_name per distinct path: "/a/b/billing?x=1" -> "billing"
+    distinct = paths.dictionary_encode()
+    names = pc.replace_substring_regex(
+        distinct.dictionary, pattern=r"^.*/", replacement="",
+        max_replacements=1)
+    names = pc.replace_substring_regex(
+        names, pattern=r"\?.*$", replacement="", max_replacements=1)
+    names = names.dictionary_encode()
+    return pa.DictionaryArray.from_arrays(
+        names.indices.take(distinct.indices), names.dictionary)
+
+
+def events_batch(matches, obj: dict) -> pa.RecordBatch:
+    # `matches` are EVENT_RE.findall tuples; `obj` a listing entry.  Columns
+    # are built by Arrow kernels, and timestamps parsed once per distinct
+    # second rather than once per line.
+    n = len(matches)
+    _, log_date = parse_log_key(obj["Key"])
+    parts = obj["Key"].split("/")
+    customer = obj.get("Customer", parts[2] if len(parts) > 3 else "")
+    ips, users, stamps, methods, paths, statuses = (
+        zip(*matches) if matches else ((),) * 6)
+    stamps = _text(stamps).dictionary_encode()
+    ts = pc.strptime(stamps.dictionary, format=TS_FORMAT, unit="s",
+                     error_is_null=True).take(stamps.indices)
+    paths = _text(paths)
+    return pa.RecordBatch.from_arrays([
+        pa.repeat(pa.scalar(log_date, pa.date32()), n),
+        ts.cast(pa.timestamp("s", tz="UTC")),
+        pa.DictionaryArray.from_arrays(
+            pa.repeat(pa.scalar(0, pa.int32()), n),
+            pa.array([customer], pa.string())),
+        _blank(_text(ips)),
+        _blank(_text(users), ("", "-")),
+        _text(methods).dictionary_encode(),
+        paths,
+        _reports(paths),
+        pc.cast(_blank(_text(statuses)), pa.int16()),
+    ], schema=SCHEMA)
+
+
+def extract_events(blocks, obj: dict) -> pa.Table:
+    # a parse function for parsing.parse_object: one RecordBatch per block
+    # of whole lines, so memory follows the compact columnar output rather
+    # than the raw log text
+    batches = [events_batch(EVENT_RE.findall(block), obj) for block in blocks]
+    return pa.Table.from_batches(batches, schema=SCHEMA)
+
+
+def read_events(body, obj: dict, stats=None) -> pa.Table:
+    # one object's raw (possibly compressed) body as an event table
+    return parse_object(body, obj, extract_events, stats=stats)
+
+
+def drop_client_ids(table: pa.Table) -> pa.Table:
+    # the same table with CLIENT_COLUMNS all null
+    for name in CLIENT_COLUMNS:
+        i = table.schema.get_field_index(name)
+        table = table.set_column(i, table.field(i),
+                                 pa.nulls(len(table), pa.string()))
+    return table
+
+
+def has_client_ids(table: pa.Table) -> bool:
+    return any(table.column(name).null_count < len(table)
+               for name in CLIENT_COLUMNS)
+
+
+def report_counts(table: pa.Table) -> dict:
+    counts = pc.value_counts(table.column("report").cast(pa.string()))
+    return {row["values"]: row["counts"] for row in counts.to_pylist()}
+
+
+def table_path(root: str, key: str, etag: str) -> str:
+    digest = object_digest(key, etag)
+    return os.path.join(root, digest[:2],
+                        f"{digest}.v{STORE_VERSION}.parquet")
+
+
+def write_table(path: str, table: pa.Table) -> int:
+    # written aside and renamed, so readers never see half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return os.path.getsize(path)
+
+
+class EventStore:
+    # Per-object event tables as Parquet, keyed by key+ETag like
+    # ResultCache:  <root>/<digest[:2]>/<digest>.v<STORE_VERSION>.parquet.
+    # Least recently read files are deleted once the store grows past
+    # `max_bytes`, except those pinned by a running query.  Sizes and
+    # recency live in an in-memory index built from the directory once, so
+    # eviction never walks it again; file mtimes carry recency across runs.
+
+    def __init__(self, root: str, max_bytes: int = 2 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pins = {}  # path -> number of runs currently reading it
+        files = []
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                if name.endswith(".parquet"):
+                    st = os.stat(os.path.join(dirpath, name))
+                    files.append((st.st_mtime, os.path.join(dirpath, name),
+                                  st.st_size))
+        # path -> size, least recently used first
+        self._index = OrderedDict(
+            (path, size) for _, path, size in sorted(files))
+        self._total = sum(self._index.values())
+
+    def path(self, key: str, etag: str) -> str:
+        return table_path(self.root, key, etag)
+
+    def has(self, obj: dict) -> bool:
+        return os.path.exists(self.path(obj["Key"], obj["ETag"]))
+
+    def get(self, obj: dict):
+        path = self.path(obj["Key"], obj["ETag"])
+        try:
+            table = pq.read_table(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+        return table.cast(SCHEMA)
+
+    def put(self, obj: dict, table: pa.Table):
+        path = self.path(obj["Key"], obj["ETag"])
+        self.added(path, write_table(path, table))
+
+    def added(self, path: str, nbytes: int):
+        # accounts for a table written to `path` (here or by a worker);
+        # while a run holds pins, eviction waits for pinned() to exit
+        with self._lock:
+            self._total += nbytes - self._index.pop(path, 0)
+            self._index[path] = nbytes
+            if self._total > self.max_bytes and not self._pins:
+                self._evict()
+
+    @contextmanager
+    def pinned(self, objects):
+        # Keeps the tables of `objects` from being evicted until the block
+        # exits, so a run larger than the store still reads every table it
+        # wrote; the store shrinks back to `max_bytes` afterwards.
+        paths = {self.path(o["Key"], o["ETag"]) for o in objects}
+        with self._lock:
+            for path in paths:
+                self._pins[path] = self._pins.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for path in paths:
+                    self._pins[path] -= 1
+                    if not self._pins[path]:
+                        del self._pins[path]
+                if self._total > self.max_bytes:
+                    self._evict()
+
+    def _evict(self):
+        for path in list(self._index):
+            if self._total <= self.max_bytes:
+                break
+            if path in self._pins:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # already gone, e.g. evicted by another process
+            self._total -= self._index.pop(path)
+
+    def paths(self, objects) -> list:
+        return [p for p in (self.path(o["Key"], o["ETag"]) for o in objects)
+                if os.path.exists(p)]
+
+
+class EventParser:
+    # Per-object parse function for fetch_each (see event_stage).  It runs
+    # in the fetch workers, threads or processes, so everything heavy about
+    # an object happens there: extracting its event table, sketching its
+    # clients and writing the table into the store under `root`.  Returns
+    # (report counts, serialised sketches or None, bytes written); being
+    # plain data, it pickles for the process pool.
+
+    def __init__(self, root: str = None, sketch: bool = False,
+                 client_ids: bool = True):
+        self.root = root
+        self.sketch = sketch
+        self.client_ids = client_ids
+
+    def __call__(self, blocks, obj: dict) -> tuple:
+        table = extract_events(blocks, obj)
+        sketches = None
+        if self.sketch:
+            sketches = {name: sketch.to_bytes()
+                        for name, sketch in table_sketches(table).items()}
+        nbytes = 0
+        if self.root is not None:
+            if not self.client_ids:
+                table = drop_client_ids(table)
+            nbytes = write_table(
+                table_path(self.root, obj["Key"], obj["ETag"]), table)
+        return report_counts(table), sketches, nbytes
+
+
+def event_stage(store: EventStore = None, sketches=None,
+                client_ids: bool = True):
+    # A fetch stage for AnalysisEngine (fetch_each with EventParser) that
+    # keeps every parsed object's event table in `store` and derives the
+    # report counts from it, so one pass over the raw log feeds both.  With
+    # `sketches` (clients.ClientSketches) each table also updates the
+    # distinct-client sketches first; unless `client_ids`, its IPs and users
+    # are then blanked before it is stored, so no client addresses are kept.
+    parse = EventParser(store.root if store is not None else None,
+                        sketches is not None, client_ids)
+
+    def finish(obj: dict, result: tuple) -> dict:
+        counts, sketched, nbytes = result
+        if sketches is not None:
+            sketches.merge(obj, sketched)
+        if store is not None:
+            store.added(store.path(obj["Key"], obj["ETag"]), nbytes)
+        return counts
+
+    return partial(fetch_each, parse=parse, finish=finish)
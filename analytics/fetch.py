@@ -0,0 +1,197 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait,
+)
+
+from botocore.exceptions import ClientError
+
+from analytics.parsing import (
+    merge_counts, parse_blocks, parse_data, parse_object,
+)
+
+DEFAULT_WORKERS = 16
+# "auto" switches to worker processes once this much raw log is pending
+PROCESS_THRESHOLD_BYTES = 256 * 1024 * 1024
+
+
+def fetch_and_parse(s3, bucket: str, obj: dict, parse=parse_blocks,
+                    stats=None):
+    try:
+        t0 = time.perf_counter()
+        body = s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"]
+        if stats:
+            stats.add("fetch", time.perf_counter() - t0, items=1)
+        try:
+            return parse_object(body, obj, parse, stats=stats)
+        finally:
+            body.close()
+    except ClientError:
+        return None
+
+
+def fetch_bytes(s3, bucket: str, key: str, stats=None):
+    try:
+        t0 = time.perf_counter()
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+        try:
+            data = body.read()
+        finally:
+            body.close()
+    except ClientError:
+        return None
+    if stats:
+        stats.add("fetch", time.perf_counter() - t0, items=1,
+                  nbytes=len(data))
+    return data
+
+
+def parse_data_timed(data: bytes, obj: dict, parse=parse_blocks):
+    # runs in a worker process, so timing travels back with the result
+    t0 = time.perf_counter()
+    result = parse_data(data, obj, parse)
+    return result, time.perf_counter() - t0
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def process_pool(processes: int) -> ProcessPoolExecutor:
+    # One long-lived pool per size, shared by all runs.  Workers come from a
+    # forkserver (spawn where unavailable): forking the multi-threaded
+    # dashboard directly could hand a child a lock held by another thread.
+    with _pools_lock:
+        pool = _pools.get(processes)
+        if pool is None or getattr(pool, "_broken", False):
+            methods = multiprocessing.get_all_start_methods()
+            method = "forkserver" if "forkserver" in methods else "spawn"
+            pool = _pools[processes] = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context(method))
+        return pool
+
+
+def choose_mode(mode: str, objects) -> str:
+    if mode != "auto":
+        return mode
+    if (os.cpu_count() or 1) < 2:
+        return "threads"
+    pending = sum(obj.get("Size", 0) for obj in objects)
+    return "processes" if pending >= PROCESS_THRESHOLD_BYTES else "threads"
+
+
+def imap_unordered(submit, items, window: int):
+    # yields (item, result) as futures finish, keeping at most `window`
+    # submitted at once so results can't pile up in memory
+    items = iter(items)
+    running = {}
+    try:
+        while True:
+            for item in items:
+                running[submit(item)] = item
+                if len(running) >= window:
+                    break
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield running.pop(fut), fut.result()
+    finally:
+        # the consumer stopped early: drop work that hasn't started yet
+        for fut in running:
+            fut.cancel()
+
+
+def _parse_in_threads(s3, bucket, objects, workers, stats, parse):
+    # boto3 clients are thread-safe, so one client is shared by all workers
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from imap_unordered(
+            lambda obj: pool.submit(
+                fetch_and_parse, s3, bucket, obj, parse, stats),
+            objects, window=workers * 2)
+
+
+def _parse_in_processes(s3, bucket, objects, workers, processes, stats,
+                        parse):
+    # threads download, worker processes parse the raw bytes; both stages
+    # are windowed so only a few objects per worker are held in memory
+    processes = processes or os.cpu_count()
+    cpu_pool = process_pool(processes)
+    with ThreadPoolExecutor(max_workers=workers) as io_pool:
+        downloads = imap_unordered(
+            lambda obj: io_pool.submit(
+                fetch_bytes, s3, bucket, obj["Key"], stats),
+            objects, window=workers * 2)
+
+        def submit_parse(item):
+            obj, data = item
+            return cpu_pool.submit(parse_data_timed, data, obj, parse)
+
+        parsed = imap_unordered(
+            submit_parse,
+            ((obj, data) for obj, data in downloads if data is not None),
+            window=processes * 2)
+        try:
+            for (obj, data), (result, secs) in parsed:
+                if stats:
+                    # decompression happens inside parse_data here
+                    stats.add("parse", secs, nbytes=len(data))
+                yield obj, result
+        finally:
+            # cancel queued work; the shared process pool stays up
+            parsed.close()
+            downloads.close()
+
+
+def fetch_each(s3, bucket: str, objects, workers: int = DEFAULT_WORKERS,
+               cache=None, mode: str = "threads", processes: int = None,
+               stats=None, parse=parse_blocks, finish=None):
+    # Yields (object, counts) for listing entries ({"Key", "ETag", ...});
+    # anything already in `cache` is served without touching S3.  `mode` is
+    # "threads", "processes" or "auto" (see choose_mode).
+    #
+    # `parse(blocks, obj)` is the per-object work done by the workers (see
+    # parsing.parse_object); it must pickle for processes mode.  Unless it
+    # returns report counts itself, `finish(obj, result)` turns each result
+    # into counts on the consumer side.
+    objects = list(objects)
+    pending = []
+    hits = []
+    t0 = time.perf_counter()
+    cached = cache.get_many(objects) if cache else {}
+    for obj in objects:
+        hit = cached.get(obj["Key"])
+        if hit is None:
+            pending.append(obj)
+        else:
+            hits.append((obj, hit))
+    if stats:
+        stats.add("cache", time.perf_counter() - t0, items=len(hits))
+    yield from hits
+
+    if choose_mode(mode, pending) == "processes":
+        results = _parse_in_processes(
+            s3, bucket, pending, workers, processes, stats, parse)
+    else:
+        results = _parse_in_threads(
+            s3, bucket, pending, workers, stats, parse)
+    for obj, part in results:
+        if part is None:
+            continue
+        if finish is not None:
+            part = finish(obj, part)
+        if cache:
+            cache.put(obj["Key"], obj["ETag"], part)
+        yield obj, part
+
+
+def fetch_all(s3, bucket: str, objects, workers: int = DEFAULT_WORKERS,
+              cache=None, mode: str = "threads", stats=None) -> dict:
+    counts = {}
+    for _, part in fetch_each(s3, bucket, objects, workers, cache, mode,
+                              stats=stats):
+        merge_counts(counts, part)
+    return counts
@@ -0,0 +1,141 @@
+import threading
+import time
+
+from analytics.engine import Cancelled, sketch_frame, to_frame
+from analytics.parsing import merge_counts
+from analytics.stats import RunStats
+from analytics.topk import SpaceSaving
+
+
+class Progress:
+    # Thread-safe tally of a running analysis, fed by AnalysisEngine.counts.
+    # With a `capacity` the running counts are a SpaceSaving summary, so
+    # an approximate run stays bounded here too.
+
+    def __init__(self, capacity: int = None):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.files_planned = self.files_done = 0
+        self.bytes_planned = self.bytes_done = 0
+        self.counts = {}
+        self.sketch = SpaceSaving(capacity) if capacity else None
+
+    def plan(self, objects):
+        with self._lock:
+            self.files_planned += len(objects)
+            self.bytes_planned += sum(o.get("Size", 0) for o in objects)
+
+    def add(self, counts: dict, obj: dict = None):
+        with self._lock:
+            if self.sketch is not None:
+                self.sketch.update(counts)
+            else:
+                merge_counts(self.counts, counts)
+            if obj is not None:
+                self.files_done += 1
+                self.bytes_done += obj.get("Size", 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            left = self.bytes_planned - self.bytes_done
+            eta = None
+            if self.bytes_done and left > 0:
+                eta = elapsed / self.bytes_done * left
+            return {
+                "files_planned": self.files_planned,
+                "files_done": self.files_done,
+                "bytes_planned": self.bytes_planned,
+                "bytes_done": self.bytes_done,
+                "elapsed": elapsed,
+                "eta": eta,
+                "counts": dict(self.sketch.counts if self.sketch
+                               else self.counts),
+            }
+
+
+class AnalysisJob:
+    # Runs AnalysisEngine.analyze on a daemon thread so the Streamlit script
+    # can keep rerunning (progress, partial results, Cancel) meanwhile.  A
+    # list of customers runs AnalysisEngine.compare instead, and `result`
+    # is then the customer x report frame.  A finished run then fills
+    # `series` ({"day"/"hour": frame}) and `clients` for the results view,
+    # from the same plan, so the dashboard itself never goes back to S3.
+
+    def __init__(self, engine, s3, customer, start, end):
+        self.engine = engine
+        self.s3 = s3
+        self.customer = customer
+        self.start_date = start
+        self.end_date = end
+        self.progress = Progress(engine.topk)
+        self.stats = RunStats()
+        self.status = "pending"  # running, done, cancelled, failed
+        self.phase = "analysis"  # then "views"
+        self.result = None
+        self.series = {}
+        self.clients = None
+        self.error = self.views_error = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.status = "running"
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def partial(self):
+        if self.progress.sketch is not None:
+            return sketch_frame(self.progress.sketch)
+        return to_frame(self.progress.snapshot()["counts"])
+
+    def _run(self):
+        try:
+            objects = self.engine.plan(self.s3, self.customer,
+                                       self.start_date, self.end_date,
+                                       self.stats)
+            run = (self.engine.analyze if isinstance(self.customer, str)
+                   else self.engine.compare)
+            self.result = run(
+                self.s3, self.customer, self.start_date, self.end_date,
+                self.stats, progress=self.progress, cancel=self._cancel,
+                objects=objects)
+        except Cancelled:
+            self.status = "cancelled"
+            return
+        except Exception as e:
+            self.error = e
+            self.status = "failed"
+            return
+
+        self.phase = "views"
+        try:
+            self._views(objects)
+        except Cancelled:
+            pass  # keep the result; the views just stay empty
+        except Exception as e:
+            self.views_error = e
+        self.status = "done"
+
+    def _views(self, objects):
+        # Skipped in top-K mode: exact per-report series and sketches for
+        # every report would undo its memory budget.
+        engine = self.engine
+        if engine.topk:
+            return
+        args = (self.s3, self.customer, self.start_date, self.end_date)
+        kwargs = {"stats": self.stats, "cancel": self._cancel,
+                  "objects": objects}
+        if engine.rollups is not None:
+            self.series["day"] = engine.timeseries(*args, "day", **kwargs)
+        if engine.events_store is not None:
+            self.series["hour"] = engine.timeseries(*args, "hour", **kwargs)
+        if engine.sketches is not None:
+            self.clients = engine.clients(*args, **kwargs)
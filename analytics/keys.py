@@ -0,0 +1,137 @@
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LOG_PREFIX = "access_logs/"
+LOG_SUFFIXES = (".txt", ".txt.gz", ".txt.zst")
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+
+
+def is_log_key(key: str) -> bool:
+    return key.endswith(LOG_SUFFIXES)
+
+
+def parse_log_key(key: str):
+    # "access_logs/<group>/<customer>/<name>.2025-04-25.txt[.gz]"
+    #   -> (stem, date)
+    for ext in COMPRESSED_SUFFIXES:
+        if key.endswith(ext):
+            key = key[:-len(ext)]
+            break
+    try:
+        stem, date_str, _ = key.rsplit(".", 2)
+        return stem, datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        return None, None
+
+
+def list_prefixes(s3, bucket: str, prefix: str, stats=None) -> list:
+    paginator = s3.get_paginator("list_objects_v2")
+    found = []
+    pages = paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/")
+    t0 = time.perf_counter()
+    for page in pages:
+        if stats:
+            stats.add("list", time.perf_counter() - t0, items=1)
+        for cp in page.get("CommonPrefixes", []):
+            found.append(cp["Prefix"])
+        t0 = time.perf_counter()
+    return found
+
+
+def list_customer_prefixes(s3, bucket: str, workers: int = 8,
+                           stats=None) -> list:
+    # access_logs/<group>/<customer>/...: only CommonPrefixes are listed, so
+    # the cost follows the number of customers, not of log files.
+    groups = list_prefixes(s3, bucket, LOG_PREFIX, stats)
+    pool_size = max(1, min(workers, len(groups)))
+    with ThreadPoolExecutor(max_workers=pool_size) as pool:
+        found = pool.map(
+            lambda group: list_prefixes(s3, bucket, group, stats), groups)
+        return [(group, prefix)
+                for group, prefixes in zip(groups, found)
+                for prefix in prefixes]
+
+
+def list_customers(s3, bucket: str, workers: int = 8, stats=None) -> list:
+    return sorted({prefix[len(group):].rstrip("/") for group, prefix
+                   in list_customer_prefixes(s3, bucket, workers, stats)})
+
+
+def customer_list(customer) -> list:
+    # `customer` is "All", one customer or a list of them; [] means all
+    if isinstance(customer, str):
+        customer = [customer]
+    return [] if "All" in customer else list(customer)
+
+
+def key_customer(key: str):
+    parts = key.split("/")
+    return parts[2] if len(parts) > 3 else None
+
+
+def customer_prefixes(s3, bucket: str, customer, stats=None) -> list:
+    # the groups are listed once, however many customers are selected
+    names = customer_list(customer)
+    if not names:
+        return [LOG_PREFIX]
+    return [f"{group}{name}/"
+            for group in list_prefixes(s3, bucket, LOG_PREFIX, stats)
+            for name in names]
+
+
+def skip_scan(s3, bucket: str, prefix: str, visit, stats=None):
+    # Lists `prefix` in key order.  `visit(obj)` returns (emit, skip_to);
+    # when skip_to is set, keys up to and including it are skipped, and the
+    # listing restarts with StartAfter only when the current page does not
+    # already reach the target.  This never costs more LIST calls than
+    # paginating the whole prefix.
+    after = None
+    skip_to = None
+    while True:
+        kwargs = {"Bucket": bucket, "Prefix": prefix}
+        if after:
+            kwargs["StartAfter"] = after
+        t0 = time.perf_counter()
+        resp = s3.list_objects_v2(**kwargs)
+        if stats:
+            stats.add("list", time.perf_counter() - t0, items=1)
+        contents = resp.get("Contents", [])
+        for obj in contents:
+            if skip_to and obj["Key"] <= skip_to:
+                continue
+            emit, skip_to = visit(obj)
+            if emit:
+                yield obj
+        if not resp.get("IsTruncated") or not contents:
+            return
+        after = max(contents[-1]["Key"], skip_to or "")
+
+
+def iter_dated_objects(s3, bucket: str, prefix: str, start, end,
+                       stats=None):
+    # Keys sort as <stem>.<YYYY-MM-DD>.<ext>, so all days of one stem are
+    # contiguous; skip each stem's out-of-range run.
+    def visit(obj):
+        stem, log_date = parse_log_key(obj["Key"])
+        if log_date is None:
+            return False, None
+        if log_date < start:
+            return False, f"{stem}.{start.isoformat()}"
+        if log_date > end:
+            # past the rest of this year's keys only: other stems such as
+            # "<stem>.eu.<date>" or "<stem>.3.<date>" sort after them
+            return False, f"{stem}.{log_date.year}-\uffff"
+        return True, None
+
+    return skip_scan(s3, bucket, prefix, visit, stats)
+
+
+def plan_keys(s3, bucket: str, customer, start, end,
+              stats=None) -> list:
+    keys = []
+    for prefix in customer_prefixes(s3, bucket, customer, stats):
+        for obj in iter_dated_objects(s3, bucket, prefix, start, end, stats):
+            if is_log_key(obj["Key"]):
+                keys.append(obj["Key"])
+    return keys
@@ -0,0 +1,149 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+from analytics.keys import (
+    LOG_PREFIX, customer_list, customer_prefixes, is_log_key,
+    list_customer_prefixes, parse_log_key, skip_scan,
+)
+
+RELIST_DAYS = 2  # trailing days per stem re-read on every refresh
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key      TEXT PRIMARY KEY,
+    stem     TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    etag     TEXT NOT NULL,
+    log_date TEXT NOT NULL,
+    customer TEXT
+);
+CREATE INDEX IF NOT EXISTS objects_date_customer ON objects (log_date, customer);
+CREATE INDEX IF NOT EXISTS objects_stem ON objects (stem, key);
+CREATE TABLE IF NOT EXISTS customers (
+    prefix   TEXT PRIMARY KEY,
+    grp      TEXT NOT NULL,
+    customer TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refreshes (
+    prefix       TEXT PRIMARY KEY,
+    refreshed_at REAL NOT NULL
+);
+"""
+
+
+class KeyManifest:
+    # On-disk index of dated log objects.  Only keys that carry a date are
+    # recorded, since those are the only ones Analyze can ever select.
+
+    def __init__(self, path: str, ttl: float = 300):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def _is_fresh(self, prefix: str) -> bool:
+        # a refresh of "access_logs/" also covers every customer below it
+        rows = self._db.execute(
+            "SELECT prefix, refreshed_at FROM refreshes").fetchall()
+        cutoff = time.time() - self.ttl
+        return any(prefix.startswith(p) and ts >= cutoff for p, ts in rows)
+
+    def refresh(self, s3, bucket: str, prefix: str = LOG_PREFIX,
+                force: bool = False, stats=None) -> int:
+        with self._lock:
+            if not force and self._is_fresh(prefix):
+                return 0
+
+            # Per stem, keys before its last RELIST_DAYS days are skipped:
+            # new days always sort after them, while the latest files may
+            # still be appended to and must have their size/ETag re-read.
+            # A forced refresh re-lists everything.
+            cursors = {}
+            if not force:
+                for stem, latest in self._db.execute(
+                        "SELECT stem, MAX(log_date) FROM objects "
+                        "WHERE key >= ? AND key < ? GROUP BY stem",
+                        (prefix, prefix + "\uffff")):
+                    cutoff = (datetime.date.fromisoformat(latest)
+                              - datetime.timedelta(days=RELIST_DAYS - 1))
+                    # "<stem>.<cutoff>" sorts just before the cutoff's key
+                    cursors[stem] = f"{stem}.{cutoff.isoformat()}"
+
+            def visit(obj):
+                stem, log_date = parse_log_key(obj["Key"])
+                if log_date is None:
+                    return False, None
+                last = cursors.get(stem)
+                if last is not None and obj["Key"] <= last:
+                    return False, last
+                return True, None
+
+            rows = []
+            for obj in skip_scan(s3, bucket, prefix, visit, stats):
+                key = obj["Key"]
+                stem, log_date = parse_log_key(key)
+                parts = key.split("/")
+                rows.append((
+                    key, stem, obj.get("Size", 0), obj.get("ETag", ""),
+                    log_date.isoformat(), parts[2] if len(parts) > 3 else None,
+                ))
+
+            with self._db:
+                if force:
+                    # drop keys that no longer exist
+                    self._db.execute(
+                        "DELETE FROM objects WHERE key >= ? AND key < ?",
+                        (prefix, prefix + "\uffff"))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)",
+                    rows)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO refreshes VALUES (?, ?)",
+                    (prefix, time.time()))
+            return len(rows)
+
+    def refresh_customer(self, s3, bucket: str, customer,
+                         force: bool = False, stats=None) -> int:
+        prefixes = customer_prefixes(s3, bucket, customer, stats)
+        return sum(self.refresh(s3, bucket, prefix, force=force, stats=stats)
+                   for prefix in prefixes)
+
+    def refresh_customers(self, s3, bucket: str, full: bool = False,
+                          workers: int = 8, stats=None) -> list:
+        # Re-lists every customer prefix (one CommonPrefixes page or so per
+        # group) and adds new ones wherever they sort; a full refresh also
+        # drops customers that have gone away.
+        found = list_customer_prefixes(s3, bucket, workers, stats)
+        with self._lock, self._db:
+            if full:
+                self._db.execute("DELETE FROM customers")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO customers VALUES (?, ?, ?)",
+                [(prefix, group, prefix[len(group):].rstrip("/"))
+                 for group, prefix in found])
+        return self.customers()
+
+    def customers(self) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT DISTINCT customer FROM customers ORDER BY customer")
+            return [customer for customer, in rows]
+
+    def lookup(self, customer, start, end) -> list:
+        sql = ("SELECT key, size, etag, log_date, customer FROM objects "
+               "WHERE log_date BETWEEN ? AND ?")
+        args = [start.isoformat(), end.isoformat()]
+        names = customer_list(customer)
+        if names:
+            sql += f" AND customer IN ({', '.join('?' * len(names))})"
+            args.extend(names)
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY key", args).fetchall()
+        return [{"Key": k, "Size": size, "ETag": etag, "Date": log_date,
+                 "Customer": customer or ""}
+                for k, size, etag, log_date, customer in rows
+                if is_log_key(k)]
@@ -0,0 +1,127 @@
+import gzip
+import io
+import re
+import time
+from collections import Counter
+
+from analytics.keys import COMPRESSED_SUFFIXES
+from analytics.stats import TimedReader
+
+# Same request match as the original per-line re.search, on raw bytes.  The
+# trailing ".*" consumes the rest of the line, so findall() resumes on the
+# next line and at most the first request of each line is counted.
+REQUEST_RE = re.compile(rb'"(?:GET|POST) (.*?) HTTP/1\.\d".*')
+CHUNK_SIZE = 256 * 1024
+
+
+def iter_chunks(body, chunk_size: int = CHUNK_SIZE):
+    # works for botocore's StreamingBody and any other file-like object
+    return iter(lambda: body.read(chunk_size), b"")
+
+
+def iter_blocks(chunks):
+    # yields runs of whole lines; a line straddling two chunks is carried
+    # over to the next block instead of being cut in half
+    tail = b""
+    for chunk in chunks:
+        buf = tail + chunk
+        cut = buf.rfind(b"\n") + 1
+        if cut:
+            yield buf[:cut]
+        tail = buf[cut:]
+    if tail:
+        yield tail
+
+
+def open_log(body, key: str):
+    # decompress on the fly, chunk by chunk, based on the key's suffix
+    if key.endswith(".gz"):
+        return gzip.GzipFile(fileobj=body, mode="rb")
+    if key.endswith(".zst"):
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(body)
+    return body
+
+
+def report_name(path: bytes) -> bytes:
+    # "/api/v1/reports/billing?from=..." -> b"billing"
+    return path[path.rfind(b"/") + 1:].partition(b"?")[0]
+
+
+def count_block(block: bytes, raw: dict) -> dict:
+    # findall and Counter run in C; Python only sees each distinct path once
+    for path, n in Counter(REQUEST_RE.findall(block)).items():
+        seg = report_name(path)
+        raw[seg] = raw.get(seg, 0) + n
+    return raw
+
+
+def decode_counts(raw: dict) -> dict:
+    counts = {}
+    for seg, n in raw.items():
+        name = seg.decode(errors="replace")
+        counts[name] = counts.get(name, 0) + n
+    return counts
+
+
+def parse_blocks(blocks, obj: dict = None) -> dict:
+    # report counts; the default per-object parser for parse_object
+    raw = {}
+    for block in blocks:
+        count_block(block, raw)
+    return decode_counts(raw)
+
+
+def parse_object(body, obj: dict, parse=parse_blocks,
+                 chunk_size: int = CHUNK_SIZE, stats=None):
+    # Runs `parse(blocks, obj)` over one log object's body, decompressed on
+    # the fly and cut into runs of whole lines, so memory stays at about one
+    # chunk (plus whatever `parse` builds), whatever the object size.  With
+    # `stats`, network reads, decompression and parsing are timed separately.
+    key = obj["Key"]
+    if stats is None:
+        return parse(iter_blocks(iter_chunks(open_log(body, key), chunk_size)),
+                     obj)
+
+    raw = TimedReader(body)
+    stream = TimedReader(open_log(raw, key))
+    lines = 0
+
+    def blocks():
+        nonlocal lines
+        for block in iter_blocks(iter_chunks(stream, chunk_size)):
+            lines += block.count(b"\n") + (not block.endswith(b"\n"))
+            yield block
+
+    t0 = time.perf_counter()
+    result = parse(blocks(), obj)
+    busy = time.perf_counter() - t0
+    stats.add("fetch", raw.seconds, nbytes=raw.nbytes)
+    if key.endswith(COMPRESSED_SUFFIXES):
+        stats.add("decode", stream.seconds - raw.seconds, nbytes=stream.nbytes)
+    # whatever parse() spent not waiting on reads
+    stats.add("parse", busy - stream.seconds, items=lines,
+              nbytes=stream.nbytes)
+    return result
+
+
+def parse_stream(body, key: str = "", chunk_size: int = CHUNK_SIZE,
+                 stats=None) -> dict:
+    return parse_object(body, {"Key": key}, parse_blocks, chunk_size, stats)
+
+
+def parse_data(data: bytes, obj: dict, parse=parse_blocks):
+    # parse_object over an object already read into memory
+    if parse is parse_blocks and not obj["Key"].endswith(COMPRESSED_SUFFIXES):
+        return parse_blocks([data])  # nothing to bound: one findall pass
+    return parse_object(io.BytesIO(data), obj, parse)
+
+
+def parse_bytes(data: bytes, key: str = "") -> dict:
+    return parse_data(data, {"Key": key})
+
+
+def merge_counts(total: dict, part: dict) -> dict:
+    for seg, n in part.items():
+        total[seg] = total.get(seg, 0) + n
+    return total
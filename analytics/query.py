@@ -0,0 +1,51 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from analytics.events import SCHEMA
+
+# grouping keys computed from a stored column: name -> (column, function)
+DERIVED = {
+    "hour": ("ts", lambda col: pc.floor_temporal(col, unit="hour")),
+    "weekday": ("ts", pc.day_of_week),
+}
+
+
+def scan(paths, columns=None, where=None) -> pa.Table:
+    # Reads stored event tables (EventStore.paths) as one Arrow table.  Only
+    # `columns` are decoded, and `where` (a pyarrow.compute expression such
+    # as pc.field("status") >= 500) is applied while scanning.
+    if not paths:
+        table = SCHEMA.empty_table()
+        return table.select(columns) if columns else table
+    dataset = ds.dataset(list(paths), schema=SCHEMA, format="parquet")
+    return dataset.to_table(columns=columns, filter=where)
+
+
+def aggregate(table: pa.Table, by=("report",)) -> pd.DataFrame:
+    # calls per distinct combination of `by`, most called first
+    by = list(by)
+    keys = {}
+    for name in by:
+        if name in DERIVED:
+            column, fn = DERIVED[name]
+            col = fn(table.column(column))
+        else:
+            col = table.column(name)
+        if pa.types.is_dictionary(col.type):
+            col = col.cast(col.type.value_type)
+        keys[name] = col
+    grouped = pa.table(keys).group_by(by).aggregate(
+        [(by[0], "count", pc.CountOptions(mode="all"))])
+    return (
+        grouped.to_pandas()
+          .rename(columns={f"{by[0]}_count": "calls"})
+          .sort_values("calls", ascending=False, ignore_index=True)
+          [by + ["calls"]]
+    )
+
+
+def calls_by(paths, by=("report",), where=None) -> pd.DataFrame:
+    columns = sorted({DERIVED[n][0] if n in DERIVED else n for n in by})
+    return aggregate(scan(paths, columns, where), by)
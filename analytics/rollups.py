@@ -0,0 +1,151 @@
+import datetime
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from analytics.keys import customer_list
+
+COLUMNS = ["customer", "report", "calls"]
+SOURCES_KEY = b"rollup_sources"
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame({
+        "customer": pd.Series(dtype="object"),
+        "report": pd.Series(dtype="object"),
+        "calls": pd.Series(dtype="int64"),
+    })
+
+
+class RollupStore:
+    # Daily (customer, report, calls) rows, one Parquet file per day:
+    #   <root>/date=YYYY-MM-DD/rollup.parquet
+    # with the {key: etag} of the objects already summed in kept in the same
+    # file's metadata, so rows and sources are replaced together.  A day
+    # only holds the objects listed in its sources, so callers ask
+    # `missing()` which objects still need parsing before querying.
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _dir(self, day: str) -> str:
+        return os.path.join(self.root, f"date={day}")
+
+    def _path(self, day: str) -> str:
+        return os.path.join(self._dir(day), "rollup.parquet")
+
+    def _sources(self, day: str) -> dict:
+        try:
+            meta = pq.read_schema(self._path(day)).metadata or {}
+        except FileNotFoundError:
+            return {}
+        if SOURCES_KEY in meta:
+            return json.loads(meta[SOURCES_KEY])
+        # days written before sources moved into the Parquet metadata
+        try:
+            with open(os.path.join(self._dir(day), "sources.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _read(self, day: str) -> pd.DataFrame:
+        path = self._path(day)
+        if not os.path.exists(path):
+            return _empty()
+        return pd.read_parquet(path)
+
+    def _write(self, day: str, df: pd.DataFrame, sources: dict):
+        os.makedirs(self._dir(day), exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            SOURCES_KEY: json.dumps(sources).encode(),
+        })
+        tmp = os.path.join(self._dir(day), "rollup.tmp")
+        pq.write_table(table, tmp)
+        # one rename, so a crash can't leave rows without their sources
+        os.replace(tmp, self._path(day))
+        try:
+            os.remove(os.path.join(self._dir(day), "sources.json"))
+        except FileNotFoundError:
+            pass
+
+    def missing(self, objects) -> list:
+        by_day = {}
+        for obj in objects:
+            by_day.setdefault(obj["Date"], []).append(obj)
+
+        todo = []
+        with self._lock:
+            for day, objs in by_day.items():
+                sources = self._sources(day)
+                if any(sources.get(o["Key"], o["ETag"]) != o["ETag"]
+                       for o in objs):
+                    # an object was rewritten; rebuild the day from scratch
+                    self._write(day, _empty(), {})
+                    sources = {}
+                todo.extend(o for o in objs if o["Key"] not in sources)
+        return todo
+
+    def add(self, results):
+        # `results` yields (object, counts) pairs as produced by fetch_each
+        by_day = {}
+        for obj, counts in results:
+            by_day.setdefault(obj["Date"], []).append((obj, counts))
+
+        with self._lock:
+            for day, parts in by_day.items():
+                sources = self._sources(day)
+                rows = [(obj["Customer"], report, n)
+                        for obj, counts in parts
+                        if obj["Key"] not in sources
+                        for report, n in counts.items()]
+                new = pd.DataFrame(rows, columns=COLUMNS).astype(
+                    {"calls": "int64"})
+                df = (
+                    pd.concat([self._read(day), new], ignore_index=True)
+                      .groupby(["customer", "report"], as_index=False)["calls"]
+                      .sum()
+                )
+                sources.update((obj["Key"], obj["ETag"]) for obj, _ in parts)
+                self._write(day, df, sources)
+
+    def _days(self, customer, start, end):
+        # (day, rows) for each day with data, read one day at a time
+        names = customer_list(customer)
+        day = start
+        while day <= end:
+            df = self._read(day.isoformat())
+            if names:
+                df = df[df["customer"].isin(names)]
+            if len(df):
+                yield day, df
+            day += datetime.timedelta(days=1)
+
+    def query(self, customer, start, end) -> pd.DataFrame:
+        frames = [df.assign(date=day)
+                  for day, df in self._days(customer, start, end)]
+        if not frames:
+            return _empty().assign(date=pd.Series(dtype="object"))
+        return pd.concat(frames, ignore_index=True)
+
+    def daily(self, customer, start, end) -> pd.DataFrame:
+        df = self.query(customer, start, end)
+        return (
+            df.groupby(["date", "report"], as_index=False)["calls"].sum()
+              [["date", "report", "calls"]]
+        )
+
+    def day_totals(self, customer, start, end):
+        # {report: calls} per day, so a caller can fold days one at a time
+        for _, df in self._days(customer, start, end):
+            yield df.groupby("report")["calls"].sum().astype(int).to_dict()
+
+    def totals(self, customer, start, end) -> dict:
+        df = self.query(customer, start, end)
+        return df.groupby("report")["calls"].sum().astype(int).to_dict()
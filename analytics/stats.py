@@ -0,0 +1,79 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+def enable_run_log(stream=None):
+    # Sends RunStats.log lines to `stream` (stderr by default) as bare JSON.
+    # Nothing configures logging for the dashboard otherwise; safe to call
+    # on every Streamlit rerun.
+    if not any(getattr(h, "_run_log", False) for h in log.handlers):
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler._run_log = True
+        log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+class RunStats:
+    # Per-stage counters for one analysis run.  `add` accumulates items
+    # (LIST pages, objects, lines, ...), bytes and busy time reported by
+    # possibly concurrent workers; `timed` measures a stage's wall time as
+    # seen by the caller.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _stage(self, name: str) -> dict:
+        return self._stages.setdefault(name, {
+            "items": 0, "bytes": 0, "seconds": 0.0, "wall": 0.0,
+        })
+
+    def add(self, name: str, seconds: float = 0.0, items: int = 0,
+            nbytes: int = 0):
+        with self._lock:
+            stage = self._stage(name)
+            stage["items"] += items
+            stage["bytes"] += nbytes
+            stage["seconds"] += seconds
+
+    @contextmanager
+    def timed(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stage(name)["wall"] += time.perf_counter() - t0
+
+    def rows(self) -> list:
+        with self._lock:
+            return [{"stage": name, **vals}
+                    for name, vals in self._stages.items()]
+
+    def log(self, **context):
+        stages = {row.pop("stage"): row for row in self.rows()}
+        log.info(json.dumps({"event": "analyze_run", **context,
+                             "stages": stages}, default=str))
+
+
+class TimedReader:
+    # file-like wrapper recording time spent in, and bytes returned by, read()
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.seconds = 0.0
+        self.nbytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        t0 = time.perf_counter()
+        data = self.raw.read(size)
+        self.seconds += time.perf_counter() - t0
+        self.nbytes += len(data)
+        return data
@@ -0,0 +1,54 @@
+import heapq
+
+
+class SpaceSaving:
+    # Mergeable Space-Saving summary of report counts (Metwally et al.,
+    # merged as in Agarwal et al., "Mergeable Summaries") holding at most
+    # `capacity` counters.  For a report with a counter, counts[r] is an
+    # upper bound on its true count and counts[r] - errors[r] a lower bound;
+    # a report without one was called at most `floor` times.  Exact counts
+    # (one object's, one day's) are folded in with update(), and summaries
+    # built by separate workers combine with merge().
+
+    def __init__(self, capacity: int = 1000):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+
+    def update(self, counts: dict):
+        self._merge(counts, {}, 0)
+
+    def merge(self, other: "SpaceSaving"):
+        self._merge(other.counts, other.errors, other.floor)
+
+    def _merge(self, counts: dict, errors: dict, floor: int):
+        # a report missing on one side may still have up to that side's
+        # floor calls, so the floor is added to both its count and error
+        merged = {}
+        merged_errors = {}
+        for report, n in self.counts.items():
+            merged[report] = n + counts.get(report, floor)
+            merged_errors[report] = (self.errors[report]
+                                     + errors.get(report, floor))
+        for report, n in counts.items():
+            if report not in merged:
+                merged[report] = n + self.floor
+                merged_errors[report] = errors.get(report, 0) + self.floor
+        self.floor += floor
+
+        if len(merged) > self.capacity:
+            ranked = heapq.nlargest(self.capacity + 1, merged, key=merged.get)
+            # anything dropped had at most the largest dropped count
+            self.floor = max(self.floor, merged[ranked[-1]])
+            merged = {r: merged[r] for r in ranked[:-1]}
+            merged_errors = {r: merged_errors[r] for r in merged}
+        self.counts = merged
+        self.errors = merged_errors
+
+    def top(self, n: int = None) -> list:
+        # [(report, count, error)], largest count first
+        ranked = sorted(self.counts, key=self.counts.get, reverse=True)
+        return [(r, self.counts[r], self.errors[r]) for r in ranked[:n]]
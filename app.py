@@ -1,41 +1,62 @@
 # app.py
-import re
 import datetime
+import hashlib
 import streamlit as st
-import boto3
 import pandas as pd
 import plotly.express as px
-from botocore.exceptions import ClientError
 
-# ── CONFIG ─────────────────────────────────────────────────────────────
-BUCKET_NAME = "data-eng-datalake-test"
-AWS_REGION = "us-west-2"
+from analytics.client import make_s3_client
+from analytics.config import (
+    BUCKET_NAME, CACHE_DIR, CONNECT_CHECK_TTL, CUSTOMER_LIST_TTL,
+    FETCH_WORKERS, LOG_RUN_STATS, MANIFEST_TTL, PARSE_MODE, RESULT_CACHE_MB,
+    TOPK_CAPACITY,
+)
+from analytics.engine import AnalysisEngine, to_frame
+from analytics.jobs import AnalysisJob
+from analytics.stats import enable_run_log
 
+# ── CONFIG ─────────────────────────────────────────────────────────────
+# shared with the CLI and benchmarks, see analytics/config.py
 st.set_page_config(page_title="App Usage Dashboard", layout="wide")
+if LOG_RUN_STATS:
+    enable_run_log()
 
 # ── CACHED HELPERS ─────────────────────────────────────────────────────
 
 
 @st.cache_resource
 def get_s3_client(key: str, secret: str):
-    return boto3.client(
-        "s3",
-        aws_access_key_id=key,
-        aws_secret_access_key=secret,
-        region_name=AWS_REGION,
+    return make_s3_client(key, secret)
+
+
+# Keyed by a digest of the credential pair; a failed check raises, and
+# exceptions are never cached, so the next rerun probes S3 again.
+@st.cache_data(ttl=CONNECT_CHECK_TTL, show_spinner=False)
+def check_connection(_s3, cred_digest: str) -> bool:
+    _s3.list_objects_v2(Bucket=BUCKET_NAME, MaxKeys=1)
+    return True
+
+
+@st.cache_resource
+def get_engine():
+    return AnalysisEngine(
+        BUCKET_NAME,
+        cache_dir=CACHE_DIR,
+        workers=FETCH_WORKERS,
+        mode=PARSE_MODE,
+        manifest_ttl=MANIFEST_TTL,
+        cache_mb=RESULT_CACHE_MB,
+        topk=TOPK_CAPACITY,
     )
 
 
-@st.cache_data(show_spinner=False)
-def fetch_customer_list(_s3):
-    paginator = _s3.get_paginator("list_objects_v2")
-    custs = set()
-    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix="access_logs/"):
-        for obj in page.get("Contents", []):
-            parts = obj["Key"].split("/")
-            if len(parts) > 2:
-                custs.add(parts[2])
-    return sorted(custs)
+# On expiry only this entry is dropped; the engine re-lists the customer
+# prefixes (about one LIST page per group) and adds any new ones.  `_full`
+# also drops customers that have gone away; being underscored, it isn't
+# part of the cache key, so a full refresh fills the same entry.
+@st.cache_data(ttl=CUSTOMER_LIST_TTL, show_spinner=False)
+def fetch_customer_list(_s3, _full: bool = False):
+    return get_engine().customers(_s3, full=_full)
 
 
 # ── SIDEBAR ────────────────────────────────────────────────────────────
@@ -49,7 +70,8 @@ if not (access_key and secret_key):
 
 try:
     s3 = get_s3_client(access_key, secret_key)
-    s3.list_objects_v2(Bucket=BUCKET_NAME, MaxKeys=1)
+    check_connection(
+        s3, hashlib.sha256(f"{access_key}\0{secret_key}".encode()).hexdigest())
     st.sidebar.success("✅ Connected")
 except Exception as e:
     st.sidebar.error(f"AWS Error: {e}")
@@ -59,8 +81,17 @@ except Exception as e:
 st.title("📊 App Usage Dashboard")
 
 # Customer + Date Range
-customers = ["All"] + fetch_customer_list(s3)
-cust = st.selectbox("Customer", customers)
+if st.sidebar.button("Refresh customers"):
+    # one full re-list of customer prefixes; other caches are left alone
+    fetch_customer_list.clear()
+    fetch_customer_list(s3, _full=True)
+customers = fetch_customer_list(s3)
+if st.toggle("Compare customers"):
+    # one pass over all selected customers, shown as a customer x report
+    # matrix below the totals
+    cust = st.multiselect("Customers", customers)
+else:
+    cust = st.selectbox("Customer", ["All"] + customers)
 
 today = datetime.date.today()
 default_start = today - datetime.timedelta(days=7)
@@ -70,61 +101,111 @@ start_date, end_date = st.date_input(
 )
 
 # ANALYZE BUTTON
-if st.button("Analyze"):
-    st.session_state.pop("analysis_df", None)
-    st.info(f"Analyzing '{cust}' from {start_date} to {end_date}…")
-    counts = {}
-    paginator = s3.get_paginator("list_objects_v2")
-
-    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix="access_logs/"):
-        for obj in page.get("Contents", []):
-            key = obj["Key"]
-            if not key.endswith(".txt"):
-                continue
-
-            # filename date filter
-            try:
-                date_str = key.rsplit(".", 2)[1]  # "2025-04-25"
-                log_date = datetime.datetime.strptime(
-                    date_str, "%Y-%m-%d").date()
-            except Exception:
-                continue
-            if not (start_date <= log_date <= end_date):
-                continue
-
-            # customer filter
-            parts = key.split("/")
-            if cust != "All" and parts[2] != cust:
-                continue
-
-            # fetch & parse
-            try:
-                body = s3.get_object(Bucket=BUCKET_NAME, Key=key)[
-                    "Body"].read().decode()
-            except ClientError:
-                continue
-            for line in body.splitlines():
-                m = re.search(r'"(?:GET|POST) (.*?) HTTP/1\.\d"', line)
-                if not m:
-                    continue
-                seg = m.group(1).split("/")[-1].split("?")[0]
-                counts[seg] = counts.get(seg, 0) + 1
-
-    if not counts:
-        st.warning("No entries found.")
-    else:
+if st.button("Analyze", disabled=not cust):
+    if "job" in st.session_state:
+        st.session_state.job.cancel()
+    for k in ("analysis_df", "analysis_note", "run_stats",
+              "analysis_series", "analysis_matrix", "analysis_clients"):
+        st.session_state.pop(k, None)
+    st.session_state.job = AnalysisJob(
+        get_engine(), s3, cust, start_date, end_date).start()
+
+# ── BACKGROUND JOB ─────────────────────────────────────────────────────
+
+
+def customer_label(customer) -> str:
+    if isinstance(customer, str):
+        return f"'{customer}'"
+    return ", ".join(f"'{c}'" for c in customer)
+
+
+def finish_job(job):
+    del st.session_state.job
+    st.session_state.run_stats = job.stats.rows()
+    if LOG_RUN_STATS:
+        job.stats.log(customer=job.customer, start=job.start_date,
+                      end=job.end_date, status=job.status)
+
+    title = (f"{customer_label(job.customer)} "
+             f"{job.start_date}–{job.end_date}")
+    df = job.result
+    if job.status == "failed":
+        # the credentials may have been revoked; re-check on the next rerun
+        check_connection.clear()
+        st.session_state.analysis_note = (
+            "error", f"Analysis failed: {job.error}")
+        return
+    if job.status == "cancelled":
+        df = job.partial()
+        title += " (cancelled, partial)"
+        st.session_state.analysis_note = ("info", "Analysis cancelled.")
+    if df.empty:
+        st.session_state.analysis_note = ("warning", "No entries found.")
+        return
+    if "customer" in df.columns:
+        # a comparison: totals drive the slider, pie and table as usual
+        st.session_state.analysis_matrix = df
         df = (
-            pd.DataFrame.from_dict(counts, orient="index", columns=["Calls"])
-              .rename_axis("Report")
-              .reset_index()
+            df.groupby("report")["calls"].sum()
+              .rename_axis("Report").reset_index(name="Calls")
               .sort_values("Calls", ascending=False)
         )
-        # store for interactive filtering
-        st.session_state.analysis_df = df
-        st.session_state.analysis_title = f"'{cust}' {start_date}–{end_date}"
+    # store for interactive filtering
+    st.session_state.analysis_df = df
+    st.session_state.analysis_title = title
+    # usage over time and distinct clients, computed by the job itself
+    # (empty in top-K mode and for cancelled runs)
+    st.session_state.analysis_series = job.series
+    st.session_state.analysis_clients = job.clients
+    if job.views_error is not None:
+        st.session_state.analysis_note = (
+            "warning", f"Usage views unavailable: {job.views_error}")
+
+
+@st.fragment(run_every=1)
+def job_progress():
+    job = st.session_state.job
+    if not job.running:
+        finish_job(job)
+        st.rerun()
+
+    snap = job.progress.snapshot()
+    if job.phase == "views":
+        st.info("Building usage-over-time and distinct-client views…")
+    else:
+        st.info(f"Analyzing {customer_label(job.customer)} from "
+                f"{job.start_date} to {job.end_date}…")
+    done, planned = snap["files_done"], snap["files_planned"]
+    eta = f", ETA {snap['eta']:.0f}s" if snap["eta"] is not None else ""
+    st.progress(
+        done / planned if planned else 0.0,
+        text=f"{done}/{planned} files, {snap['bytes_done'] / 1e6:.1f}/"
+             f"{snap['bytes_planned'] / 1e6:.1f} MB{eta}",
+    )
+    if st.button("Cancel"):
+        job.cancel()
+
+    partial = to_frame(snap["counts"])
+    if not partial.empty:
+        st.caption("Partial results so far")
+        st.dataframe(partial.head(10), hide_index=True,
+                     use_container_width=True)
+
+
+if "job" in st.session_state:
+    job_progress()
+
+if "analysis_note" in st.session_state:
+    level, msg = st.session_state.analysis_note
+    getattr(st, level)(msg)
 
 # ── INTERACTIVE RESULTS ─────────────────────────────────────────────────
-if "analysis_df" in st.session_state:
+
+
+# A fragment, so moving the slider reruns only this function: the chart and
+# table are redrawn from session state without touching S3.
+@st.fragment
+def results_view():
     df = st.session_state.analysis_df
     title = st.session_state.analysis_title
     max_n = len(df)
@@ -150,5 +231,85 @@ if "analysis_df" in st.session_state:
     )
     st.plotly_chart(fig, use_container_width=True)
 
-    # Data table
+    # Data table, optionally with distinct clients per report
+    clients = st.session_state.get("analysis_clients")
+    if clients is not None and st.checkbox(
+            "Show distinct clients",
+            help="Estimated unique client IPs and authenticated users "
+                 "(HyperLogLog, about ±2%)"):
+        df_top = df_top.merge(
+            clients.rename(columns={"report": "Report",
+                                    "clients": "Clients",
+                                    "users": "Users"}),
+            on="Report", how="left")
     st.dataframe(df_top.reset_index(drop=True), use_container_width=True)
+    if "Error" in df.columns:
+        st.caption(
+            "Approximate top-K: each count is at most its Error above the "
+            "true number of calls; reports not listed had at most "
+            f"{df.attrs.get('floor', 0):,} calls."
+        )
+
+    # Customer comparison for the same top N reports
+    if "analysis_matrix" in st.session_state:
+        matrix = st.session_state.analysis_matrix
+        matrix = matrix[matrix["report"].isin(df_top["Report"])]
+        bars, heat = st.tabs(["Grouped bars", "Heatmap"])
+        with bars:
+            fig = px.bar(
+                matrix,
+                x="report",
+                y="calls",
+                color="customer",
+                barmode="group",
+                title=f"Top {top_n} reports by customer for {title}"
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        with heat:
+            grid = (
+                matrix.pivot_table(index="customer", columns="report",
+                                   values="calls", fill_value=0)
+                      .reindex(columns=df_top["Report"], fill_value=0)
+            )
+            fig = px.imshow(grid, text_auto=True, aspect="auto",
+                            color_continuous_scale="Blues")
+            st.plotly_chart(fig, use_container_width=True)
+
+    # Usage over time for the same top N reports
+    series = st.session_state.get("analysis_series")
+    if not series:
+        return
+    freq = st.radio(
+        "Usage over time",
+        list(series),
+        format_func={"day": "Daily", "hour": "Hourly"}.get,
+        horizontal=True,
+        key="series_freq"
+    )
+    shown = series[freq]
+    shown = shown[shown["report"].isin(df_top["Report"])]
+    fig = px.line(
+        shown,
+        x="date" if freq == "day" else "hour",
+        y="calls",
+        color="report",
+        markers=True,
+        title=f"Calls per {freq} for {title}"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+
+if "analysis_df" in st.session_state:
+    results_view()
+
+# ── RUN STATS ──────────────────────────────────────────────────────────
+if "run_stats" in st.session_state:
+    with st.expander("Run stats"):
+        st.dataframe(
+            pd.DataFrame(st.session_state.run_stats).rename(columns={
+                "stage": "Stage", "items": "Items", "bytes": "Bytes",
+                "seconds": "Busy (s)", "wall": "Wall (s)",
+            }),
+            use_container_width=True,
+            hide_index=True,
+        )
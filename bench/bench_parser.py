@@ -0,0 +1,62 @@
+# Lines-per-second of the bytes-level parser against the original
+# str/regex loop from the Analyze handler.
+#
+#   python -m bench.bench_parser [--lines 500000] [--repeat 3]
+import argparse
+import datetime
+import io
+import random
+import re
+import time
+
+from analytics.parsing import parse_bytes, parse_stream
+from bench.synth import log_file
+
+
+def legacy_parse(data: bytes) -> dict:
+    counts = {}
+    for line in data.decode().splitlines():
+        m = re.search(r'"(?:GET|POST) (.*?) HTTP/1\.\d"', line)
+        if not m:
+            continue
+        seg = m.group(1).split("/")[-1].split("?")[0]
+        counts[seg] = counts.get(seg, 0) + 1
+    return counts
+
+
+def best_of(fn, data: bytes, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=500_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    data = log_file(random.Random(args.seed), datetime.date(2025, 4, 25),
+                    args.lines)
+    assert parse_bytes(data) == legacy_parse(data), "parsers disagree"
+
+    print(f"{args.lines:,} lines, {len(data) / 1e6:.1f} MB")
+    base = None
+    variants = [
+        ("legacy", legacy_parse),
+        ("bytes", parse_bytes),
+        ("stream", lambda d: parse_stream(io.BytesIO(d))),
+    ]
+    for name, fn in variants:
+        secs = best_of(fn, data, args.repeat)
+        base = base or secs
+        print(f"{name:>8}: {args.lines / secs:>12,.0f} lines/s "
+              f"({base / secs:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# End-to-end timing of customer discovery and the Analyze pipeline against a
+# filesystem-backed S3 stand-in filled with synthetic access logs.
+#
+#   python -m bench.bench_pipeline --customers 20 --days 30 --lines 2000 \
+#       [--latency-ms 20] [--workers 16] [--mode auto] [--gzip]
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from analytics.engine import AnalysisEngine
+from bench.fake_s3 import FakeS3
+from bench.synth import generate
+
+BUCKET = "bench"
+
+
+def report(name, secs, files, lines, s3):
+    print(f"{name:>22}: {secs:8.3f}s  {files / secs:10,.1f} files/s  "
+          f"{lines / secs:12,.0f} lines/s  "
+          f"LIST={s3.requests['ListObjectsV2']} GET={s3.requests['GetObject']}")
+    s3.reset_requests()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--customers", type=int, default=20)
+    ap.add_argument("--groups", type=int, default=2)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--lines", type=int, default=2000)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--workers", type=int, default=16)
+    ap.add_argument("--mode", default="auto",
+                    choices=["threads", "processes", "auto"])
+    ap.add_argument("--gzip", action="store_true")
+    ap.add_argument("--root", help="reuse/keep generated data here")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.root or os.path.join(tmp, "bucket")
+        end = datetime.date.today()
+        start = end - datetime.timedelta(days=args.days - 1)
+        if not os.path.isdir(os.path.join(root, "access_logs")):
+            t0 = time.perf_counter()
+            n = generate(root, args.customers, args.days, args.lines,
+                         groups=args.groups, end=end, compress=args.gzip)
+            print(f"generated {n} files in {time.perf_counter() - t0:.1f}s")
+
+        s3 = FakeS3(root, latency=args.latency_ms / 1000)
+        engine = AnalysisEngine(BUCKET, cache_dir=os.path.join(tmp, "cache"),
+                                workers=args.workers, mode=args.mode)
+        t0 = time.perf_counter()
+        custs = engine.customers(s3)
+        report("fetch_customer_list", time.perf_counter() - t0,
+               len(custs), 0, s3)
+
+        planner = AnalysisEngine(BUCKET, cache_dir=None)
+        for customer in [custs[0], "All"]:
+            files = len(planner.plan(s3, customer, start, end))
+            s3.reset_requests()
+            for label in ["cold", "warm"]:
+                t0 = time.perf_counter()
+                engine.analyze(s3, customer, start, end)
+                # every generated line, HEAD probes included; the reported
+                # calls would undercount, and are upper bounds under top-K
+                report(f"analyze {customer[:8]} {label}",
+                       time.perf_counter() - t0, files,
+                       files * args.lines, s3)
+
+
+if __name__ == "__main__":
+    main()
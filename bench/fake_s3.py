@@ -0,0 +1,100 @@
+# Filesystem-backed stand-in for the subset of the boto3 S3 client the
+# dashboard uses.  Objects are files under `root`; keys are their relative
+# paths.  `latency` adds a fixed delay per request to mimic S3 round trips.
+import bisect
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+
+class FakeS3:
+    def __init__(self, root: str, latency: float = 0.0):
+        self.root = root
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.reset_requests()
+        self.rescan()
+
+    def reset_requests(self):
+        with self._lock:
+            self.requests = {"ListObjectsV2": 0, "GetObject": 0}
+
+    def rescan(self):
+        keys = []
+        for dirpath, _, files in os.walk(self.root):
+            rel = os.path.relpath(dirpath, self.root)
+            for name in files:
+                path = name if rel == "." else f"{rel}/{name}"
+                keys.append(path.replace(os.sep, "/"))
+        self._keys = sorted(keys)
+
+    def _request(self, op: str):
+        with self._lock:
+            self.requests[op] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _head(self, key: str) -> dict:
+        st = os.stat(os.path.join(self.root, key))
+        return {"Key": key, "Size": st.st_size,
+                "ETag": f'"{st.st_size:x}-{st.st_mtime_ns:x}"'}
+
+    def list_objects_v2(self, Bucket, Prefix="", Delimiter=None,
+                        StartAfter="", ContinuationToken=None,
+                        MaxKeys=1000, **_):
+        self._request("ListObjectsV2")
+        after = max(StartAfter, ContinuationToken or "")
+        i = bisect.bisect_right(self._keys, after) if after else \
+            bisect.bisect_left(self._keys, Prefix)
+        contents, prefixes, last = [], [], None
+        while i < len(self._keys) and len(contents) + len(prefixes) < MaxKeys:
+            key = self._keys[i]
+            if not key.startswith(Prefix):
+                break
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                common = Prefix + rest.split(Delimiter, 1)[0] + Delimiter
+                prefixes.append({"Prefix": common})
+                # jump past every key under this common prefix
+                last = common + "\uffff"
+                i = bisect.bisect_right(self._keys, last)
+                continue
+            contents.append(self._head(key))
+            last = key
+            i += 1
+        truncated = i < len(self._keys) and self._keys[i].startswith(Prefix)
+        resp = {"Contents": contents, "CommonPrefixes": prefixes,
+                "KeyCount": len(contents) + len(prefixes),
+                "IsTruncated": truncated}
+        if truncated:
+            resp["NextContinuationToken"] = last
+        return resp
+
+    def get_paginator(self, op: str):
+        assert op == "list_objects_v2", op
+        return _Paginator(self)
+
+    def get_object(self, Bucket, Key, **_):
+        self._request("GetObject")
+        path = os.path.join(self.root, Key)
+        if not os.path.isfile(path):
+            raise ClientError(
+                {"Error": {"Code": "NoSuchKey", "Message": Key}}, "GetObject")
+        head = self._head(Key)
+        return {"Body": open(path, "rb"), "ETag": head["ETag"],
+                "ContentLength": head["Size"]}
+
+
+class _Paginator:
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, **kwargs):
+        while True:
+            page = self.client.list_objects_v2(**kwargs)
+            yield page
+            if not page["IsTruncated"]:
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
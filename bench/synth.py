@@ -0,0 +1,53 @@
+import datetime
+import gzip
+import os
+import random
+
+REPORTS = [
+    "usage_summary", "billing", "invoices", "active_users", "retention",
+    "funnel", "exports", "audit_log", "settings", "health",
+]
+METHODS = ["GET"] * 8 + ["POST"] * 2
+
+
+def log_line(rng: random.Random, day: datetime.date) -> str:
+    ip = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+    ts = f"{day:%d/%b/%Y}:{rng.randrange(24):02d}:{rng.randrange(60):02d}:00"
+    roll = rng.random()
+    if roll < 0.05:
+        # lines the parser must skip
+        return f'{ip} - - [{ts} +0000] "HEAD / HTTP/1.1" 200 0 "-" "probe"'
+    path = f"/api/v1/reports/{rng.choice(REPORTS)}"
+    if roll < 0.4:
+        path += f"?from={day}&page={rng.randrange(10)}"
+    return (f'{ip} - - [{ts} +0000] "{rng.choice(METHODS)} {path} HTTP/1.1" '
+            f'200 {rng.randrange(100, 50000)} "-" "Mozilla/5.0"')
+
+
+def log_file(rng: random.Random, day: datetime.date, lines: int) -> bytes:
+    return "\n".join(log_line(rng, day) for _ in range(lines)).encode() + b"\n"
+
+
+def generate(root: str, customers: int, days: int, lines: int,
+             groups: int = 2, end: datetime.date = None, seed: int = 0,
+             compress: bool = False) -> int:
+    # writes access_logs/<group>/<customer>/access.<YYYY-MM-DD>.txt[.gz]
+    # and returns the number of files written
+    rng = random.Random(seed)
+    end = end or datetime.date.today()
+    written = 0
+    for g in range(groups):
+        for c in range(customers):
+            folder = os.path.join(
+                root, "access_logs", f"app{g}", f"cust{c:03d}")
+            os.makedirs(folder, exist_ok=True)
+            for d in range(days):
+                day = end - datetime.timedelta(days=d)
+                data = log_file(rng, day, lines)
+                name = f"access.{day}.txt"
+                if compress:
+                    data, name = gzip.compress(data), name + ".gz"
+                with open(os.path.join(folder, name), "wb") as f:
+                    f.write(data)
+                written += 1
+    return written
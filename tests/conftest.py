@@ -0,0 +1,48 @@
+import datetime
+import os
+
+import pytest
+
+from bench.fake_s3 import FakeS3
+
+DAY = datetime.date(2025, 4, 25)
+
+
+def log_lines(day: datetime.date, report: str, n: int, ip_base: int = 0,
+              user: str = "-") -> str:
+    return "".join(
+        f'10.0.{(ip_base + i) // 250}.{(ip_base + i) % 250} - {user} '
+        f'[{day:%d/%b/%Y}:10:00:00 +0000] '
+        f'"GET /api/v1/reports/{report} HTTP/1.1" 200 5 "-" "test"\n'
+        for i in range(n))
+
+
+class Bucket:
+    # a FakeS3 over tmp_path, with helpers to add or append to log files;
+    # like S3 listings, new keys only show up after rescan()
+
+    def __init__(self, root):
+        self.root = str(root)
+        self.s3 = FakeS3(self.root)
+
+    def write(self, key: str, data, append: bool = False):
+        # `data` is str or bytes
+        if isinstance(data, str):
+            data = data.encode()
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab" if append else "wb") as f:
+            f.write(data)
+        self.s3.rescan()
+
+    def log(self, customer: str, day: datetime.date, report: str = "billing",
+            n: int = 10, stem: str = "access", group: str = "app0",
+            append: bool = False, **kwargs) -> str:
+        key = f"access_logs/{group}/{customer}/{stem}.{day}.txt"
+        self.write(key, log_lines(day, report, n, **kwargs), append)
+        return key
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    return Bucket(tmp_path / "bucket")
@@ -0,0 +1,49 @@
+from analytics.cache import ResultCache
+
+
+def obj(key: str, etag: str = "1") -> dict:
+    return {"Key": key, "ETag": etag}
+
+
+def test_get_many_returns_hits_for_the_same_etag_only(tmp_path):
+    cache = ResultCache(str(tmp_path / "r.sqlite"))
+    cache.put("a", "1", {"billing": 2})
+    cache.put("b", "1", {"exports": 1})
+    assert cache.get_many([obj("a"), obj("b", "2"), obj("c")]) == \
+        {"a": {"billing": 2}}
+    assert cache.get("b", "1") == {"exports": 1}
+    assert cache.get("b", "2") is None
+
+
+def test_get_many_touches_hits_in_one_statement(tmp_path):
+    cache = ResultCache(str(tmp_path / "r.sqlite"))
+    for key in "abc":
+        cache.put(key, "1", {"r": 1})
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    cache.get_many([obj(k) for k in "abc"])
+    updates = [s for s in statements if s.startswith("UPDATE")]
+    commits = [s for s in statements if s == "COMMIT"]
+    # executemany traces each row, but all within a single transaction
+    assert len(updates) == 3 and len(commits) == 1
+
+
+def test_total_is_kept_without_rescanning(tmp_path):
+    path = str(tmp_path / "r.sqlite")
+    cache = ResultCache(path)
+    cache.put("a", "1", {"billing": 2})
+    cache.put("a", "1", {"billing": 20})  # replaced, not added
+    size = len('{"billing":20}')
+    assert cache._total == size
+    assert ResultCache(path)._total == size
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    entry = len('{"r":1}')
+    cache = ResultCache(str(tmp_path / "r.sqlite"), max_bytes=3 * entry)
+    for key in "abc":
+        cache.put(key, "1", {"r": 1})
+    cache.get_many([obj("a")])  # now b is the oldest
+    cache.put("d", "1", {"r": 1})
+    assert set(cache.get_many([obj(k) for k in "abcd"])) == {"a", "c", "d"}
+    assert cache._total == 3 * entry
@@ -0,0 +1,68 @@
+import io
+
+import pandas as pd
+import pytest
+
+from analytics import cli
+from tests.conftest import DAY
+
+EXPECTED = {"billing": 4, "exports": 6}
+
+
+@pytest.fixture
+def run(bucket, tmp_path, monkeypatch):
+    bucket.log("acme", DAY, report="billing", n=4)
+    bucket.log("globex", DAY, report="exports", n=6)
+    monkeypatch.setattr(cli, "make_s3_client", lambda **_: bucket.s3)
+
+    def run(*argv):
+        cli.main(["--bucket", "b", "--cache-dir", str(tmp_path / "cache"),
+                  "--mode", "threads", *argv,
+                  "--start", DAY.isoformat(), "--end", DAY.isoformat()])
+    return run
+
+
+def calls(df) -> dict:
+    return dict(zip(df["Report"], df["Calls"]))
+
+
+@pytest.mark.parametrize("fmt,read", [
+    ("csv", pd.read_csv),
+    ("parquet", pd.read_parquet),
+    ("json", pd.read_json),
+])
+def test_analyze_writes_each_format_by_extension(run, tmp_path, fmt, read):
+    path = tmp_path / f"out.{fmt}"
+    run("analyze", "-o", str(path))
+    assert calls(read(path)) == EXPECTED
+
+
+def test_format_flag_overrides_the_extension(run, tmp_path):
+    path = tmp_path / "out.data"
+    run("analyze", "-o", str(path), "--format", "json")
+    assert calls(pd.read_json(path)) == EXPECTED
+
+
+def test_csv_to_stdout_and_stats_to_stderr(run, capsys):
+    run("analyze", "--customer", "acme", "--stats")
+    out, err = capsys.readouterr()
+    assert calls(pd.read_csv(io.StringIO(out))) == {"billing": 4}
+    assert '"stage"' in err
+
+
+def test_compare_wide_has_a_column_per_customer(run, tmp_path):
+    path = tmp_path / "wide.csv"
+    run("compare", "--customers", "acme,globex", "--wide", "-o", str(path))
+    wide = pd.read_csv(path).set_index("report")
+    assert wide.loc["billing", "acme"] == 4
+    assert wide.loc["billing", "globex"] == 0
+    assert wide.loc["exports", "globex"] == 6
+
+
+@pytest.mark.parametrize("argv", [
+    ("analyze", "--format", "parquet"),  # parquet needs a file
+    ("analyze", "-o", "out.xlsx"),
+])
+def test_bad_output_options_exit(run, argv):
+    with pytest.raises(SystemExit):
+        run(*argv)
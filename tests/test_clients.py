@@ -0,0 +1,64 @@
+import io
+
+import pytest
+
+from analytics.clients import ClientSketches
+from analytics.events import read_events
+from tests.conftest import DAY, log_lines
+
+
+def parsed(key: str, etag: str, text: str):
+    obj = {"Key": key, "ETag": etag, "Date": DAY.isoformat(),
+           "Customer": "acme"}
+    return obj, read_events(io.BytesIO(text.encode()), obj)
+
+
+def test_distinct_counts_clients_and_users(tmp_path):
+    sketches = ClientSketches(str(tmp_path / "c.sqlite"))
+    text = (log_lines(DAY, "billing", 100, user="alice")
+            + log_lines(DAY, "billing", 100, user="bob")
+            + log_lines(DAY, "exports", 20, ip_base=500))
+    sketches.add(*parsed("a", "1", text))
+    df = sketches.distinct("acme", DAY, DAY).set_index("report")
+    assert df.loc["billing", "clients"] == pytest.approx(100, rel=0.03)
+    assert df.loc["billing", "users"] == 2
+    assert df.loc["exports", "clients"] == pytest.approx(20, rel=0.03)
+    assert df.loc["exports", "users"] == 0
+
+
+def test_sketches_merge_across_objects_once(tmp_path):
+    sketches = ClientSketches(str(tmp_path / "c.sqlite"))
+    a = parsed("a", "1", log_lines(DAY, "billing", 50))
+    b = parsed("b", "1", log_lines(DAY, "billing", 50, ip_base=25))
+    sketches.add(*a)
+    sketches.add(*b)
+    sketches.add(*a)  # already merged in
+    clients, = sketches.distinct("acme", DAY, DAY)["clients"]
+    assert clients == pytest.approx(75, rel=0.03)
+
+
+def test_rewritten_object_replaces_only_its_sketches(tmp_path):
+    sketches = ClientSketches(str(tmp_path / "c.sqlite"))
+    a = parsed("a", "1", log_lines(DAY, "billing", 50))
+    b = parsed("b", "1", log_lines(DAY, "billing", 10, ip_base=1000))
+    sketches.add(*a)
+    sketches.add(*b)
+
+    rewritten = parsed("a", "2", log_lines(DAY, "billing", 5))
+    assert sketches.missing([rewritten[0], b[0]]) == [rewritten[0]]
+    clients, = sketches.distinct("acme", DAY, DAY)["clients"]
+    assert clients == pytest.approx(10, rel=0.03)
+    sketches.add(*rewritten)
+    clients, = sketches.distinct("acme", DAY, DAY)["clients"]
+    assert clients == pytest.approx(15, rel=0.03)
+
+
+def test_add_matches_sources_on_key_and_etag(tmp_path):
+    # a rewrite sketched before missing() saw it still replaces the old one
+    sketches = ClientSketches(str(tmp_path / "c.sqlite"))
+    sketches.add(*parsed("a", "1", log_lines(DAY, "billing", 50)))
+    rewritten = parsed("a", "2", log_lines(DAY, "billing", 5))
+    sketches.add(*rewritten)
+    assert sketches.missing([rewritten[0]]) == []
+    clients, = sketches.distinct("acme", DAY, DAY)["clients"]
+    assert clients == 5
@@ -0,0 +1,41 @@
+import gzip
+import io
+import random
+
+import pytest
+import zstandard
+
+from analytics.fetch import fetch_all
+from analytics.parsing import parse_bytes, parse_stream
+from bench.synth import log_file
+from tests.conftest import DAY
+
+COMPRESS = {
+    ".gz": gzip.compress,
+    ".zst": lambda data: zstandard.ZstdCompressor().compress(data),
+}
+
+
+@pytest.fixture(scope="module")
+def log() -> bytes:
+    return log_file(random.Random(2), DAY, 3000)
+
+
+@pytest.mark.parametrize("suffix", sorted(COMPRESS))
+def test_compressed_logs_count_like_plain_ones(log, suffix):
+    data = COMPRESS[suffix](log)
+    key = f"access.{DAY}.txt{suffix}"
+    plain = parse_bytes(log)
+    assert parse_stream(io.BytesIO(data), key, chunk_size=1000) == plain
+    assert parse_bytes(data, key) == plain
+
+
+@pytest.mark.parametrize("mode", ["threads", "processes"])
+def test_mixed_objects_through_the_pipeline(bucket, log, mode):
+    keys = []
+    for i, suffix in enumerate(["", ".gz", ".zst"]):
+        key = f"access_logs/app0/c{i}/access.{DAY}.txt{suffix}"
+        bucket.write(key, COMPRESS[suffix](log) if suffix else log)
+        keys.append(key)
+    counts = fetch_all(bucket.s3, "b", [{"Key": k} for k in keys], mode=mode)
+    assert counts == {r: 3 * n for r, n in parse_bytes(log).items()}
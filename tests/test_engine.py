@@ -0,0 +1,104 @@
+import datetime
+
+import pytest
+
+from analytics.engine import AnalysisEngine
+from analytics.jobs import Progress
+from analytics.query import scan
+from bench.synth import generate
+from tests.conftest import DAY
+
+START = DAY - datetime.timedelta(days=4)
+
+
+@pytest.fixture
+def synth_bucket(bucket):
+    generate(bucket.root, customers=3, days=5, lines=200, end=DAY)
+    bucket.s3.rescan()
+    return bucket
+
+
+def engine(tmp_path, **kwargs) -> AnalysisEngine:
+    kwargs.setdefault("mode", "threads")
+    return AnalysisEngine(bucket="b", cache_dir=str(tmp_path / "cache"),
+                          **kwargs)
+
+
+def reference(bucket, customer="All", start=START, end=DAY) -> dict:
+    # no caches at all: list, fetch and count from scratch
+    plain = AnalysisEngine(bucket="b", cache_dir=None, mode="threads")
+    return plain.counts(bucket.s3, customer, start, end)
+
+
+def totals(df) -> dict:
+    return dict(zip(df["Report"], df["Calls"]))
+
+
+def test_rewritten_latest_log_is_reparsed(synth_bucket, tmp_path):
+    for keep_events in (True, False):
+        cached = engine(tmp_path / str(keep_events), keep_events=keep_events,
+                        manifest_ttl=0)
+        cached.analyze(synth_bucket.s3, "cust000", START, DAY)
+        synth_bucket.log("cust000", DAY, report="billing", n=7, append=True)
+        df = cached.analyze(synth_bucket.s3, "cust000", START, DAY)
+        assert totals(df) == reference(synth_bucket, "cust000")
+
+
+def test_event_store_smaller_than_a_run_keeps_totals(synth_bucket, tmp_path):
+    # every table is evicted as soon as it's written, unless the running
+    # query has it pinned
+    expected = reference(synth_bucket)
+    small = engine(tmp_path, events_mb=0)
+    df = small.analyze(synth_bucket.s3, "All", START, DAY)
+    assert totals(df) == expected
+    assert small.events_store._total == 0
+
+    # a repeat Analyze is answered from the rollups, not the event tables
+    gets = synth_bucket.s3.requests["GetObject"]
+    df = small.analyze(synth_bucket.s3, "All", START, DAY)
+    assert totals(df) == expected
+    assert synth_bucket.s3.requests["GetObject"] == gets
+
+    # an hourly query reads them all again, and its progress starts from
+    # the rollups
+    progress = Progress()
+    hourly = small.query(synth_bucket.s3, "All", START, DAY,
+                         by=("hour", "report"), progress=progress)
+    assert hourly.groupby("report")["calls"].sum().to_dict() == expected
+    assert progress.snapshot()["counts"] == expected
+    assert small.events_store._total == 0
+
+
+def test_client_ids_are_dropped_from_stored_tables(synth_bucket, tmp_path):
+    for keep in (False, True):
+        e = engine(tmp_path / str(keep), keep_client_ids=keep)
+        e.analyze(synth_bucket.s3, "cust001", DAY, DAY)
+        objects = e.plan(synth_bucket.s3, "cust001", DAY, DAY)
+        table = scan(e.events_store.paths(objects), ["ip"])
+        assert (table.column("ip").null_count == len(table)) is not keep
+
+        # rebuilding the sketches re-reads the raw logs if need be
+        clients = e.clients(synth_bucket.s3, "cust001", DAY, DAY)
+        e.sketches._db.execute("DELETE FROM sketches")
+        e.sketches._db.execute("DELETE FROM sources")
+        assert e.clients(synth_bucket.s3, "cust001", DAY, DAY).equals(clients)
+
+
+def test_rewritten_log_is_sketched_again_alone(bucket, tmp_path):
+    for customer in ("acme", "globex"):
+        for stem in ("access", "error"):
+            bucket.log(customer, DAY, n=50, stem=stem)
+    e = engine(tmp_path, manifest_ttl=0)
+    e.analyze(bucket.s3, "All", DAY, DAY)
+    e.clients(bucket.s3, "All", DAY, DAY)
+
+    # the rest of the day keeps its sketches, though its stored tables
+    # have no client IDs to rebuild them from: one GET either way
+    for ip_base, steps in ((50, ("clients",)), (80, ("analyze", "clients"))):
+        bucket.log("acme", DAY, n=30, ip_base=ip_base, append=True)
+        gets = bucket.s3.requests["GetObject"]
+        for step in steps:
+            df = getattr(e, step)(bucket.s3, "All", DAY, DAY)
+        assert bucket.s3.requests["GetObject"] - gets == 1
+        clients, = df["clients"]
+        assert clients == pytest.approx(ip_base + 30, rel=0.03)
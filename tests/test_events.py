@@ -0,0 +1,87 @@
+import datetime
+import io
+
+import pyarrow.parquet as pq
+
+from analytics.clients import ClientSketches
+from analytics.events import EventStore, event_stage, read_events
+from analytics.fetch import fetch_each
+from bench.synth import generate
+from tests.conftest import DAY, log_lines
+
+
+def test_event_columns():
+    key = f"access_logs/app0/acme/access.{DAY}.txt"
+    text = (
+        b'10.0.0.1 - alice [25/Apr/2025:10:00:01 +0200] '
+        b'"GET /api/v1/reports/billing?x=1 HTTP/1.1" 200 5 "-" "test"\n'
+        b'10.0.0.2 - - [25/Apr/2025:10:00:01 +0200] '
+        b'"POST /usage HTTP/1.1" 503 5 "-" "test"\n'
+        b'"GET /api/v1/reports/billing HTTP/1.1"\n'
+        b'10.0.0.3 - - [not a time] "GET /a/b HTTP/1.1" 200 5\n')
+    table = read_events(io.BytesIO(text), {"Key": key}).to_pylist()
+    assert [row["report"] for row in table] == [
+        "billing", "usage", "billing", "b"]
+    assert [row["user"] for row in table] == ["alice", None, None, None]
+    assert [row["ip"] for row in table] == [
+        "10.0.0.1", "10.0.0.2", None, "10.0.0.3"]
+    assert [row["status"] for row in table] == [200, 503, None, 200]
+    # one timestamp parse per distinct stamp, still per row in the table
+    stamp = datetime.datetime(2025, 4, 25, 8, 0, 1,
+                              tzinfo=datetime.timezone.utc)
+    assert [row["ts"] for row in table] == [stamp, stamp, None, None]
+    assert {row["date"] for row in table} == {DAY}
+    assert {row["customer"] for row in table} == {"acme"}
+
+
+def test_event_stage_in_processes_matches_threads(bucket, tmp_path):
+    generate(bucket.root, customers=2, days=2, lines=300, end=DAY)
+    bucket.s3.rescan()
+    objects = [dict(bucket.s3._head(key), Date=DAY.isoformat())
+               for key in bucket.s3._keys]
+    results = {}
+    for mode in ("threads", "processes"):
+        store = EventStore(str(tmp_path / mode))
+        sketches = ClientSketches(str(tmp_path / mode / "clients.sqlite"))
+        stage = event_stage(store, sketches, client_ids=False)
+        results[mode] = {obj["Key"]: part for obj, part in
+                         stage(bucket.s3, "b", objects, mode=mode)}
+        # the workers wrote every table, without client IDs, and the
+        # consumer accounted for its size
+        paths = store.paths(objects)
+        assert len(paths) == len(objects)
+        assert pq.read_table(paths[0]).column("ip").null_count == \
+            pq.read_metadata(paths[0]).num_rows
+        assert store._total > 0
+        assert sketches.missing(objects) == []
+    assert results["threads"] == results["processes"]
+    assert sum(sum(c.values()) for c in results["threads"].values()) > 0
+
+
+def test_event_store_evicts_least_recently_used(tmp_path):
+    table = read_events(io.BytesIO(log_lines(DAY, "billing", 50).encode()),
+                        {"Key": f"access_logs/app0/acme/access.{DAY}.txt"})
+    objects = [{"Key": f"k{i}", "ETag": "e"} for i in range(4)]
+    store = EventStore(str(tmp_path / "events"))
+    store.put(objects[0], table)
+    size = store._total
+    store.max_bytes = 2 * size
+
+    store.put(objects[1], table)
+    assert store.get(objects[0]) is not None  # now the most recent
+    store.put(objects[2], table)
+    assert [store.has(o) for o in objects[:3]] == [True, False, True]
+
+    # while pinned nothing goes; the store shrinks back on exit
+    with store.pinned(objects[:1]):
+        store.put(objects[1], table)
+        store.put(objects[3], table)
+        assert all(store.has(o) for o in objects)
+    assert store._total == 2 * size
+    assert [store.has(o) for o in objects] == [False, True, False, True]
+
+    # a new store picks the files and their recency up from disk
+    again = EventStore(store.root, max_bytes=size)
+    assert again._total == 2 * size
+    again.put(objects[2], table)
+    assert [again.has(o) for o in objects] == [False, False, True, False]
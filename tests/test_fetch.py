@@ -0,0 +1,58 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from analytics.fetch import fetch_all, imap_unordered, process_pool
+from bench.synth import generate
+from tests.conftest import DAY
+
+
+def test_process_mode_matches_threads_and_reuses_its_pool(bucket):
+    generate(bucket.root, customers=2, days=3, lines=300, end=DAY)
+    bucket.s3.rescan()
+    objects = [{"Key": key} for key in bucket.s3._keys]
+    threads = fetch_all(bucket.s3, "b", objects, mode="threads")
+    assert fetch_all(bucket.s3, "b", objects, mode="processes") == threads
+    pool = process_pool(2)
+    assert process_pool(2) is pool
+    assert pool._mp_context.get_start_method() != "fork"
+
+
+def test_imap_unordered_yields_every_item_within_the_window():
+    lock = threading.Lock()
+    running = peak = 0
+
+    def work(i):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.002)
+        with lock:
+            running -= 1
+        return i * i
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = dict(imap_unordered(
+            lambda i: pool.submit(work, i), range(50), window=3))
+    assert results == {i: i * i for i in range(50)}
+    assert peak <= 3
+
+
+def test_imap_unordered_cancels_pending_work_when_closed_early():
+    started = []
+    gate = threading.Event()
+
+    def work(i):
+        started.append(i)
+        gate.wait(1)
+        return i
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        results = imap_unordered(
+            lambda i: pool.submit(work, i), range(100), window=4)
+        gate.set()
+        next(results)
+        results.close()
+    # at most the window was ever submitted, and queued work was dropped
+    assert len(started) <= 4
@@ -0,0 +1,63 @@
+import pyarrow as pa
+import pytest
+
+from analytics.hll import HyperLogLog, hash_values
+
+
+def sketch(values) -> HyperLogLog:
+    hll = HyperLogLog()
+    hll.update(list(values))
+    return hll
+
+
+@pytest.mark.parametrize("n", [10, 1000, 50000])
+def test_count_is_close(n):
+    assert sketch(f"10.0.0.{i}" for i in range(n)).count() == \
+        pytest.approx(n, rel=0.05)
+
+
+def test_add_matches_update():
+    one_by_one = HyperLogLog()
+    for i in range(100):
+        one_by_one.add(str(i))
+    assert one_by_one.registers == sketch(str(i) for i in range(100)).registers
+
+
+def test_empty_counts_zero():
+    assert HyperLogLog().count() == 0
+    assert HyperLogLog.union([]).count() == 0
+
+
+def test_merge_and_union_match_a_sketch_of_everything():
+    a = sketch(str(i) for i in range(0, 3000))
+    b = sketch(str(i) for i in range(2000, 6000))
+    both = sketch(str(i) for i in range(6000))
+    union = HyperLogLog.union([a, b.to_bytes()])
+    a.merge(b)
+    assert a.registers == both.registers == union.registers
+
+
+def test_bytes_round_trip():
+    hll = sketch(str(i) for i in range(100))
+    assert HyperLogLog.from_bytes(hll.to_bytes()).registers == hll.registers
+
+
+def test_precisions_must_match():
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(10))
+
+
+def test_grouped_matches_one_sketch_per_group():
+    values = [f"10.0.{i // 250}.{i % 250}" for i in range(3000)]
+    groups = [i % 3 for i in range(3000)]
+    expected = [sketch(v for v, g in zip(values, groups) if g == group)
+                for group in range(3)]
+    grouped = HyperLogLog.grouped(groups, values, 3)
+    assert [s.registers for s in grouped] == [s.registers for s in expected]
+
+
+def test_hashes_cover_unicode_and_long_values():
+    values = ["", "é", "x" * 300, "x" * 299 + "y", "10.0.0.1"]
+    assert len(set(hash_values(values).tolist())) == len(values)
+    assert hash_values(pa.array(values).slice(2, 2)).tolist() == \
+        hash_values(values[2:4]).tolist()
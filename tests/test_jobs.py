@@ -0,0 +1,77 @@
+import datetime
+import time
+
+import pytest
+
+from analytics.engine import AnalysisEngine
+from analytics.jobs import AnalysisJob
+from bench.synth import generate
+from tests.conftest import DAY
+
+START = DAY - datetime.timedelta(days=4)
+
+
+@pytest.fixture
+def synth_bucket(bucket):
+    generate(bucket.root, customers=3, days=5, lines=200, end=DAY)
+    bucket.s3.rescan()
+    return bucket
+
+
+def finished(job, timeout: float = 30) -> AnalysisJob:
+    job._thread.join(timeout)
+    assert not job.running
+    return job
+
+
+def engine(tmp_path, **kwargs) -> AnalysisEngine:
+    return AnalysisEngine(bucket="b", cache_dir=str(tmp_path / "cache"),
+                          mode="threads", **kwargs)
+
+
+def test_done_job_has_result_and_views(synth_bucket, tmp_path):
+    e = engine(tmp_path)
+    job = finished(AnalysisJob(e, synth_bucket.s3, "All", START, DAY).start())
+    assert job.status == "done" and job.error is None
+    plain = AnalysisEngine(bucket="b", cache_dir=None, mode="threads")
+    expected = plain.counts(synth_bucket.s3, "All", START, DAY)
+    assert dict(zip(job.result["Report"], job.result["Calls"])) == expected
+    assert job.progress.snapshot()["files_done"] == 30
+    assert set(job.series) == {"day", "hour"}
+    assert job.series["day"]["calls"].sum() == sum(expected.values())
+
+
+def test_cancel_keeps_partial_counts(synth_bucket, tmp_path):
+    synth_bucket.s3.latency = 0.02
+    e = engine(tmp_path, workers=2)
+    job = AnalysisJob(e, synth_bucket.s3, "All", START, DAY).start()
+    deadline = time.monotonic() + 10
+    while job.progress.snapshot()["files_done"] < 3:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    job.cancel()
+    finished(job)
+    assert job.status == "cancelled"
+    done = job.progress.snapshot()["files_done"]
+    assert 3 <= done < 30
+    partial = job.partial()
+    assert 0 < partial["Calls"].sum() < 30 * 200
+
+
+def test_failure_is_reported(tmp_path):
+    class Broken:
+        def __getattr__(self, name):
+            raise RuntimeError("no S3 here")
+
+    job = finished(AnalysisJob(engine(tmp_path), Broken(), "All",
+                               START, DAY).start())
+    assert job.status == "failed"
+    assert "no S3 here" in str(job.error)
+
+
+def test_topk_job_skips_exact_views(synth_bucket, tmp_path):
+    e = engine(tmp_path, topk=5)
+    job = finished(AnalysisJob(e, synth_bucket.s3, "All", START, DAY).start())
+    assert job.status == "done"
+    assert len(job.result) <= 5 and "Error" in job.result
+    assert job.series == {} and job.clients is None
@@ -0,0 +1,87 @@
+import datetime
+
+from analytics.keys import iter_dated_objects, plan_keys, skip_scan
+from tests.conftest import DAY
+
+
+class PagedS3:
+    # FakeS3 with small pages, so skips have pages to cross
+    def __init__(self, s3, page: int):
+        self.s3 = s3
+        self.page = page
+
+    def list_objects_v2(self, **kwargs):
+        return self.s3.list_objects_v2(MaxKeys=self.page, **kwargs)
+
+
+def test_skip_scan_jumps_past_skipped_keys(bucket):
+    for i in range(20):
+        bucket.write(f"p/k{i:02d}", "")
+    paged = PagedS3(bucket.s3, page=3)
+
+    def visit(obj):
+        # keep k00, then jump straight to k15
+        return obj["Key"] == "p/k00" or obj["Key"] > "p/k15", "p/k15"
+
+    bucket.s3.reset_requests()
+    keys = [o["Key"] for o in skip_scan(paged, "b", "p/", visit)]
+    assert keys == ["p/k00", "p/k16", "p/k17", "p/k18", "p/k19"]
+    # one page to find k00, one restarting after k15 (plus its tail page)
+    assert bucket.s3.requests["ListObjectsV2"] <= 3
+
+
+def test_skip_scan_never_lists_more_than_plain_pagination(bucket):
+    for i in range(10):
+        bucket.write(f"p/k{i}", "")
+    paged = PagedS3(bucket.s3, page=4)
+    bucket.s3.reset_requests()
+    keys = [o["Key"] for o in skip_scan(paged, "b", "p/",
+                                        lambda obj: (True, None))]
+    assert len(keys) == 10
+    assert bucket.s3.requests["ListObjectsV2"] == 3
+
+
+def test_iter_dated_objects_keeps_stems_sorting_after_the_range(bucket):
+    # "access.eu.<date>" sorts after every "access.<date>"; skipping past
+    # the end of "access" must not skip it too
+    days = [DAY + datetime.timedelta(days=d) for d in range(-3, 4)]
+    for day in days:
+        bucket.log("acme", day)
+        bucket.log("acme", day, stem="access.eu")
+    paged = PagedS3(bucket.s3, page=2)
+    found = [o["Key"].rsplit("/", 1)[1] for o in iter_dated_objects(
+        paged, "b", "access_logs/app0/acme/", DAY, DAY)]
+    assert found == [f"access.{DAY}.txt", f"access.eu.{DAY}.txt"]
+
+
+def test_iter_dated_objects_keeps_stems_with_a_numeric_suffix(bucket):
+    # "access.3.<date>" must survive skipping past the end of "access"
+    days = [DAY + datetime.timedelta(days=d) for d in range(-2, 3)]
+    for day in days:
+        bucket.log("acme", day)
+        bucket.log("acme", day, stem="access.3")
+    paged = PagedS3(bucket.s3, page=2)
+    found = [o["Key"].rsplit("/", 1)[1] for o in iter_dated_objects(
+        paged, "b", "access_logs/app0/acme/", DAY, DAY)]
+    assert found == [f"access.{DAY}.txt", f"access.3.{DAY}.txt"]
+
+
+def test_iter_dated_objects_skips_later_years(bucket):
+    for year in range(2020, 2031):
+        bucket.log("acme", DAY.replace(year=year))
+    paged = PagedS3(bucket.s3, page=2)
+    found = list(iter_dated_objects(paged, "b", "access_logs/app0/acme/",
+                                    DAY.replace(year=2021),
+                                    DAY.replace(year=2022)))
+    assert len(found) == 2
+
+
+def test_plan_keys_selects_customers_and_days(bucket):
+    for customer in ("acme", "globex", "initech"):
+        for d in range(3):
+            bucket.log(customer, DAY - datetime.timedelta(days=d))
+    keys = plan_keys(bucket.s3, "b", ["acme", "initech"],
+                     DAY - datetime.timedelta(days=1), DAY)
+    assert sorted(keys) == sorted(
+        f"access_logs/app0/{c}/access.{DAY - datetime.timedelta(days=d)}.txt"
+        for c in ("acme", "initech") for d in range(2))
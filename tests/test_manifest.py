@@ -0,0 +1,71 @@
+import datetime
+import os
+
+from analytics.manifest import RELIST_DAYS, KeyManifest
+from tests.conftest import DAY
+
+WEEK = [DAY - datetime.timedelta(days=d) for d in range(7)]
+
+
+def etags(manifest, customer="acme"):
+    return {o["Key"]: o["ETag"]
+            for o in manifest.lookup(customer, WEEK[-1], WEEK[0])}
+
+
+def test_refresh_rereads_appended_latest_day(bucket, tmp_path):
+    key = [bucket.log("acme", day) for day in WEEK][0]
+    manifest = KeyManifest(str(tmp_path / "m.sqlite"), ttl=0)
+    manifest.refresh(bucket.s3, "b")
+    before = etags(manifest)
+
+    bucket.log("acme", DAY, n=5, append=True)
+    manifest.refresh(bucket.s3, "b")
+    after = etags(manifest)
+    assert after[key] != before[key]
+    assert {k: v for k, v in after.items() if k != key} == \
+        {k: v for k, v in before.items() if k != key}
+
+
+def test_refresh_skips_known_days_but_lists_new_ones(bucket, tmp_path):
+    for day in WEEK[1:]:
+        bucket.log("acme", day)
+    manifest = KeyManifest(str(tmp_path / "m.sqlite"), ttl=0)
+    manifest.refresh(bucket.s3, "b")
+    new = bucket.log("acme", DAY)
+    # only the stem's trailing RELIST_DAYS and the new day come back
+    assert manifest.refresh(bucket.s3, "b") == RELIST_DAYS + 1
+    assert new in etags(manifest)
+
+
+def test_forced_refresh_sees_old_rewrites_and_deletions(bucket, tmp_path):
+    keys = [bucket.log("acme", day) for day in WEEK]
+    manifest = KeyManifest(str(tmp_path / "m.sqlite"), ttl=0)
+    manifest.refresh(bucket.s3, "b")
+    before = etags(manifest)
+
+    old, gone = keys[-1], keys[-2]
+    bucket.log("acme", WEEK[-1], n=3, append=True)
+    os.remove(os.path.join(bucket.root, gone))
+    bucket.s3.rescan()
+    manifest.refresh(bucket.s3, "b", force=True)
+    after = etags(manifest)
+    assert after[old] != before[old]
+    assert gone not in after
+
+
+def test_ttl_refresh_finds_customers_sorting_first(bucket, tmp_path):
+    bucket.log("mmm", DAY)
+    bucket.log("zzz", DAY)
+    manifest = KeyManifest(str(tmp_path / "m.sqlite"))
+    assert manifest.refresh_customers(bucket.s3, "b") == ["mmm", "zzz"]
+
+    bucket.log("aaa_new", DAY)
+    assert manifest.refresh_customers(bucket.s3, "b") == \
+        ["aaa_new", "mmm", "zzz"]
+
+    os.remove(os.path.join(bucket.root, "access_logs/app0/zzz",
+                           f"access.{DAY}.txt"))
+    os.rmdir(os.path.join(bucket.root, "access_logs/app0/zzz"))
+    bucket.s3.rescan()
+    assert manifest.refresh_customers(bucket.s3, "b", full=True) == \
+        ["aaa_new", "mmm"]
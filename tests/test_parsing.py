@@ -0,0 +1,68 @@
+import io
+import random
+import re
+
+import pytest
+
+from analytics.parsing import (
+    iter_blocks, iter_chunks, parse_bytes, parse_stream,
+)
+from bench.synth import log_file
+from tests.conftest import DAY
+
+
+@pytest.fixture(scope="module")
+def log() -> bytes:
+    return log_file(random.Random(1), DAY, 2000)
+
+
+def test_blocks_hold_whole_lines_whatever_the_chunk_size(log):
+    for size in (1, 7, 100, 4096):
+        blocks = list(iter_blocks(iter_chunks(io.BytesIO(log), size)))
+        assert b"".join(blocks) == log
+        assert all(block.endswith(b"\n") for block in blocks)
+
+
+def test_last_line_without_newline_is_kept():
+    blocks = list(iter_blocks([b"one\ntw", b"o\nthr", b"ee"]))
+    assert blocks == [b"one\n", b"two\n", b"three"]
+
+
+@pytest.mark.parametrize("size", [1, 13, 1000, 1 << 20])
+def test_counts_do_not_depend_on_chunk_size(log, size):
+    whole = parse_stream(io.BytesIO(log), chunk_size=len(log))
+    assert parse_stream(io.BytesIO(log), chunk_size=size) == whole
+    assert sum(whole.values()) > 1500
+
+
+def per_line_counts(data: bytes) -> dict:
+    # the original per-line parser from app.py, kept as the reference
+    counts = {}
+    for line in data.decode().splitlines():
+        m = re.search(r'"(?:GET|POST) (.*?) HTTP/1\.\d"', line)
+        if not m:
+            continue
+        seg = m.group(1).split("/")[-1].split("?")[0]
+        counts[seg] = counts.get(seg, 0) + 1
+    return counts
+
+
+EDGE_CASES = b"""\
+1.2.3.4 - - [x] "GET /api/v1/reports/billing?from=1&to=2 HTTP/1.1" 200 1
+1.2.3.4 - - [x] "POST /api/v1/reports/exports HTTP/1.0" 201 1
+1.2.3.4 - - [x] "HEAD /api/v1/reports/billing HTTP/1.1" 200 1
+1.2.3.4 - - [x] "GET /api/v1/reports/ HTTP/1.1" 200 1
+1.2.3.4 - - [x] "GET /a/one HTTP/1.1" "GET /a/two HTTP/1.1" 200 1
+1.2.3.4 - - [x] "GET /a/crlf HTTP/1.1" 200 1\r
+not a log line at all
+
+"GET /bare?q HTTP/1.1"
+1.2.3.4 - - [x] "GET /a/caf\xc3\xa9 HTTP/1.1" 200 1
+1.2.3.4 - - [x] "GET /a/no-newline HTTP/1.1" 200 1"""
+
+
+def test_bytes_parser_matches_the_per_line_parser(log):
+    for data in (log, EDGE_CASES, log + EDGE_CASES):
+        assert parse_bytes(data) == per_line_counts(data)
+        assert parse_stream(io.BytesIO(data), chunk_size=17) == \
+            per_line_counts(data)
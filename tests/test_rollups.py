@@ -0,0 +1,39 @@
+from analytics.rollups import RollupStore
+from tests.conftest import DAY
+
+
+def obj(key: str, etag: str, day=DAY, customer="acme") -> dict:
+    return {"Key": key, "ETag": etag, "Date": day.isoformat(),
+            "Customer": customer}
+
+
+def test_add_sums_each_object_once(tmp_path):
+    store = RollupStore(str(tmp_path))
+    a, b = obj("a", "1"), obj("b", "1")
+    store.add([(a, {"billing": 2}), (b, {"billing": 3, "exports": 1})])
+    store.add([(a, {"billing": 2})])  # already summed in
+    assert store.totals("acme", DAY, DAY) == {"billing": 5, "exports": 1}
+    assert store.missing([a, b, obj("c", "1")]) == [obj("c", "1")]
+
+
+def test_rewritten_object_rebuilds_its_day(tmp_path):
+    store = RollupStore(str(tmp_path))
+    a, b = obj("a", "1"), obj("b", "1")
+    store.add([(a, {"billing": 2}), (b, {"billing": 3})])
+
+    # sums can't be taken apart, so every object of the day is redone
+    rewritten = obj("a", "2")
+    assert store.missing([rewritten, b]) == [rewritten, b]
+    assert store.totals("acme", DAY, DAY) == {}
+    store.add([(rewritten, {"billing": 4}), (b, {"billing": 3})])
+    assert store.totals("acme", DAY, DAY) == {"billing": 7}
+    assert store.missing([rewritten, b]) == []
+
+
+def test_sources_live_in_the_rollup_file(tmp_path):
+    store = RollupStore(str(tmp_path))
+    store.add([(obj("a", "1"), {"billing": 2})])
+    day = tmp_path / f"date={DAY}"
+    # rows and sources are replaced by one rename, so nothing else is kept
+    assert sorted(p.name for p in day.iterdir()) == ["rollup.parquet"]
+    assert RollupStore(str(tmp_path)).missing([obj("a", "1")]) == []
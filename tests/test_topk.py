@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from analytics.topk import SpaceSaving
+
+
+def test_exact_while_under_capacity():
+    sketch = SpaceSaving(10)
+    sketch.update({"a": 5, "b": 2})
+    sketch.update({"a": 1, "c": 7})
+    assert sketch.top() == [("c", 7, 0), ("a", 6, 0), ("b", 2, 0)]
+    assert sketch.floor == 0
+
+
+def test_bounds_hold_after_merging_small_summaries():
+    rng = random.Random(0)
+    reports = [f"r{i}" for i in range(200)]
+    weights = [1 / (i + 1) for i in range(len(reports))]
+    parts = [{} for _ in range(8)]
+    for part in parts:
+        for report in rng.choices(reports, weights, k=2000):
+            part[report] = part.get(report, 0) + 1
+    true = {}
+    for part in parts:
+        for report, n in part.items():
+            true[report] = true.get(report, 0) + n
+
+    merged = SpaceSaving(20)
+    for part in parts:
+        worker = SpaceSaving(20)
+        worker.update(part)
+        merged.merge(worker)
+
+    assert len(merged.counts) <= 20
+    for report, count, error in merged.top():
+        assert count - error <= true[report] <= count
+    for report, n in true.items():
+        if report not in merged.counts:
+            assert n <= merged.floor
+    # the heaviest hitters survive
+    assert {r for r, _, _ in merged.top(3)} == {"r0", "r1", "r2"}
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        SpaceSaving(0)